@@ -6,95 +6,123 @@ import pandas as pd
 import pydeck as pdk
 import os
 import base64
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 import humanize
-import sqlite3
+from functools import lru_cache
 import plotly.express as px
-import spacy
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderUnavailable, GeocoderTimedOut
 
-from config import MEDIA_DIR, DB_PATH
+from config import LIVE_REFRESH_SECONDS
+from utils.coord_utils import extract_coordinates, is_precise
+from utils.data_utils import prepare_dashboard_frame, query_dashboard_rows
+from utils.db_utils import connect, fetch_messages_by_ids, init_schema, search_message_ids
+from utils.entity_utils import (
+    find_messages, indexed_message_ids, messages_for_entities,
+    places_for_messages, top_entities
+)
+from utils.geocode_utils import GeocoderUnavailable, get_geocoder
+from utils.map_utils import to_layer_records
+from utils.media_utils import (
+    IMAGE_EXTENSIONS, VIDEO_EXTENSIONS, thumbnail_path,
+    resolve as resolve_media, touch as touch_media
+)
+from utils.nlp_utils import extract_places_batch
+from utils.snapshot_utils import SnapshotRefresher
+from utils.report_utils import generate_history_report
+from utils.selection_utils import (
+    add_to_selection, ids_in_bbox, ids_in_time_range,
+    ids_matching_location, ids_from_map_selection
+)
 
 
 # ----------------- Location Extraction Utilities -----------------
 
-# Load NLP model for location extraction
-nlp = spacy.load("en_core_web_sm")
-geolocator = Nominatim(user_agent="telegram-map")
+# NER models are loaded per language on first use (utils.nlp_utils)
+geocoder = get_geocoder("telegram-map")
 
-def extract_places(text):
-    doc = nlp(text)
-    return [ent.text for ent in doc.ents if ent.label_ in ("GPE", "LOC")]
+# Fallback resolution per message id, so snapshot rebuilds never re-run NER on the same row
+_fallback_locations = {}
 
-@st.cache_data(show_spinner=False)
+# lru_cache instead of st.cache_data: called from the refresher thread, outside any session;
+# GeocoderUnavailable propagates, so lookups that got no answer are not cached
+@lru_cache(maxsize=4096)
 def geocode_place(place):
-    try:
-        location = geolocator.geocode(place, timeout=5)
-        if location:
-            return location.latitude, location.longitude, location.address
-    except (GeocoderUnavailable, GeocoderTimedOut):
-        return None, None, None
+    location, _ = geocoder.geocode_blocking(place)
+    if location:
+        return location.latitude, location.longitude, location.address
     return None, None, None
 
 
 # ----------------- Load Data with Fallback Geolocation -----------------
 
-@st.cache_data(ttl=60)
-def load_data():
+def resolve_unplaced(unplaced):
+    # Fallback location detection via coordinates, then indexed entities (NER only
+    # for messages missing from the entity index) + geocode
+    pending = unplaced[~unplaced['id'].isin(_fallback_locations.keys())]
+    needs_places, low_precision = [], {}
+    for row in pending.itertuples():
+        coordinates = extract_coordinates(row.text or "")
+        if is_precise(coordinates):
+            c = coordinates[0]
+            _fallback_locations[row.id] = (c['lat'], c['lon'], c['name'])
+        else:
+            needs_places.append(row)
+            if coordinates:
+                c = coordinates[0]
+                low_precision[row.id] = (c['lat'], c['lon'], c['name'])
+
+    ids = [row.id for row in needs_places]
+    stored, indexed = places_for_messages(ids), indexed_message_ids(ids)
+    needs_ner = [row for row in needs_places if row.id not in indexed]
+    places_by_id = {row.id: stored.get(row.id, []) for row in needs_places if row.id in indexed}
+    places_by_id.update(zip((r.id for r in needs_ner), extract_places_batch([r.text or "" for r in needs_ner])))
+
+    for msg_id, places in places_by_id.items():
+        # Cue-marked short decimal pairs only win when no place resolves
+        fallback, unavailable = low_precision.get(msg_id), False
+        for place in places:
+            try:
+                lat, lon, resolved = geocode_place(place)
+            except GeocoderUnavailable:
+                unavailable = True
+                continue
+            if lat and lon:
+                fallback, unavailable = (lat, lon, resolved or place.title()), False
+                break
+        # Left out when the geocoders were down, so the next refresh retries it
+        if not unavailable:
+            _fallback_locations[msg_id] = fallback
+
+    # Forget rows that left the time window
+    for stale in _fallback_locations.keys() - set(unplaced['id']):
+        del _fallback_locations[stale]
+
+    return _fallback_locations
+
+
+def build_snapshot():
+    return prepare_dashboard_frame(query_dashboard_rows(), resolve_unplaced)
+
+
+@st.cache_resource
+def get_refresher():
+    # One refresher per server process, shared by every session; migrate older
+    # databases first so the entity tables the snapshot reads exist
+    conn = connect()
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            query = '''
-                SELECT DISTINCT
-                    m.id, m.text, m.timestamp, m.media_paths,
-                    l.lat AS latitude, l.lon AS longitude, 
-                    COALESCE(l.location_name, 'Ubicación desconocida') AS location_name
-                FROM messages m
-                LEFT JOIN locations l ON m.id = l.message_id
-                WHERE m.timestamp > datetime('now', '-3 days')
-                GROUP BY m.id
-                ORDER BY m.timestamp DESC
-                LIMIT 500
-            '''
-            df = pd.read_sql(query, conn)
-
-        if df.empty:
-            return df
-
-        df = df[
-            (df['latitude'].between(-90, 90)) & 
-            (df['longitude'].between(-180, 180)) |
-            (df['latitude'].isna()) |
-            (df['longitude'].isna())
-        ].copy()
-
-        df['timestamp'] = pd.to_datetime(df['timestamp'], utc=True)
-        df['time_ago'] = (datetime.now(timezone.utc) - df['timestamp']).apply(humanize.naturaltime)
-        df['location_name'] = df['location_name'].str.title()
-        df['flag'] = None  # Placeholder
-
-        # Fallback location detection via NER + geocode
-        for i, row in df.iterrows():
-            if pd.isna(row['latitude']) or pd.isna(row['longitude']):
-                places = extract_places(row['text'] or "")
-                for place in places:
-                    lat, lon, resolved = geocode_place(place)
-                    if lat and lon:
-                        df.at[i, 'latitude'] = lat
-                        df.at[i, 'longitude'] = lon
-                        df.at[i, 'location_name'] = resolved or place.title()
-                        break
-
-        # Drop rows that still have no valid coordinates
-        df = df[
-            (df['latitude'].notna()) & (df['longitude'].notna()) &
-            (df['latitude'].between(-90, 90)) & (df['longitude'].between(-180, 180))
-        ].copy()
-
-        return df
-    except Exception as e:
-        st.error(f"Error cargando datos: {str(e)}")
+        init_schema(conn)
+    finally:
+        conn.close()
+    return SnapshotRefresher(build_snapshot)
+
+
+def load_data():
+    snapshot = get_refresher().get(timeout=120)
+    if snapshot is None:
+        st.warning("Cargando datos...")
         return pd.DataFrame()
+    if snapshot.error:
+        st.error(f"Error cargando datos: {snapshot.error}")
+    return snapshot.data if snapshot.data is not None else pd.DataFrame()
 
 
 # ----------------- Media Renderer -----------------
@@ -104,18 +132,30 @@ def render_media(media_paths):
     media_files = media_paths.split(",")
     for media_file in media_files:
         media_file = media_file.strip()
-        media_path = os.path.join(MEDIA_DIR, media_file)
-        if media_file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
-            st.image(media_path, caption="Imagen del mensaje")
-        elif media_file.lower().endswith(('.mp4', '.webm', '.mov')):
-            st.video(media_path)
+        media_path = resolve_media(media_file)
+        if media_file.lower().endswith(IMAGE_EXTENSIONS):
+            if os.path.exists(media_path):
+                touch_media(media_path)
+                st.image(media_path, caption="Imagen del mensaje")
+            elif os.path.exists(thumbnail_path(media_path)):
+                # Full-size file evicted by the retention job
+                st.image(thumbnail_path(media_path), caption="Imagen del mensaje (miniatura)")
+        elif media_file.lower().endswith(VIDEO_EXTENSIONS):
+            if os.path.exists(media_path):
+                touch_media(media_path)
+                st.video(media_path)
+            else:
+                st.caption("Video no disponible (eliminado por retención)")
 
 # ----------------- Session State Init -----------------
-if "selected_points" not in st.session_state:
-    st.session_state.selected_points = []
+if "selected_ids" not in st.session_state:
+    st.session_state.selected_ids = set()
+
+if "live_new_ids" not in st.session_state:
+    st.session_state.live_new_ids = set()
 
-if "last_refresh" not in st.session_state:
-    st.session_state.last_refresh = datetime.now()
+if "entity_filter" not in st.session_state:
+    st.session_state.entity_filter = []
 
 if "map_zoom" not in st.session_state:
     st.session_state.map_zoom = 6
@@ -131,7 +171,9 @@ st.markdown("Visualización geoespacial de mensajes con medios e inteligencia co
 # ----------------- Sidebar -----------------
 with st.sidebar:
     st.header("Controles")
-    st.info(f"Última carga: {st.session_state.last_refresh.strftime('%Y-%m-%d %H:%M:%S')}")
+    last_snapshot = get_refresher().get(timeout=0)
+    if last_snapshot is not None:
+        st.info(f"Última carga: {last_snapshot.built_at.strftime('%Y-%m-%d %H:%M:%S')}")
 
     st.subheader("Configuración del Mapa")
     base_radius = st.slider("Tamaño base de punto", 10, 200, 50)
@@ -149,10 +191,23 @@ with st.sidebar:
     selected_style = st.selectbox("Estilo del mapa", list(map_style_options.keys()))
     st.session_state.map_style = map_style_options[selected_style]
 
+    live_mode = st.toggle("Modo en vivo", value=False,
+                          help=f"Actualiza el mapa y los mensajes cada {LIVE_REFRESH_SECONDS} s")
+
     st.subheader("Generar Reporte")
-    if len(st.session_state.selected_points) > 0:
-        if st.button("Generar Reporte"):
-            report_df = pd.DataFrame(st.session_state.selected_points)
+    # Always shown: the selection can grow inside the live fragment without a full rerun
+    if st.button("Generar Reporte"):
+        if not st.session_state.selected_ids:
+            st.warning("No hay mensajes seleccionados")
+        else:
+            report_df = fetch_messages_by_ids(st.session_state.selected_ids)
+            # Fill coordinates resolved by the dashboard's fallback geocoding
+            loaded = load_data()
+            if not loaded.empty:
+                geo_cols = ['latitude', 'longitude', 'location_name']
+                resolved = loaded.set_index('id')[geo_cols]
+                missing = report_df['latitude'].isna() & report_df['id'].isin(resolved.index)
+                report_df.loc[missing, geo_cols] = resolved.loc[report_df.loc[missing, 'id'], geo_cols].values
             st.session_state.report = {
                 "total_messages": len(report_df),
                 "date_range": f"{report_df['timestamp'].min().date()} — {report_df['timestamp'].max().date()}",
@@ -172,13 +227,79 @@ with st.sidebar:
             st.success("Reporte generado")
 
     if st.button("Limpiar Selección"):
-        st.session_state.selected_points = []
+        st.session_state.selected_ids = set()
         st.session_state.report = {}
         st.session_state.pop("map_center", None)
 
+    st.subheader("Análisis Histórico")
+    today = datetime.now(timezone.utc).date()
+    history_range = st.date_input("Periodo", (today - timedelta(days=30), today))
+    if st.button("Analizar Periodo") and len(history_range) == 2:
+        st.session_state.history_report = generate_history_report(*history_range)
+
 # ----------------- Data Load -----------------
 data = load_data()
 
+# ----------------- Bulk Selection -----------------
+with st.sidebar:
+    if not data.empty:
+        with st.expander("Selección masiva"):
+            search = st.text_input("Buscar texto o ubicación")
+            if st.button("Agregar resultados de búsqueda") and search:
+                matches = ids_matching_location(data, search) + search_message_ids(search, data['id'])
+                added = add_to_selection(st.session_state.selected_ids, matches)
+                st.success(f"{added} mensajes agregados")
+
+            t_min = data['timestamp'].min().to_pydatetime()
+            t_max = data['timestamp'].max().to_pydatetime()
+            if t_min < t_max:
+                t_range = st.slider("Rango de tiempo", t_min, t_max, (t_min, t_max),
+                                    step=timedelta(minutes=15), format="MM-DD HH:mm")
+                if st.button("Agregar rango de tiempo"):
+                    added = add_to_selection(st.session_state.selected_ids, ids_in_time_range(data, *t_range))
+                    st.success(f"{added} mensajes agregados")
+
+            lat_range = st.slider("Latitud", -90.0, 90.0,
+                                  (float(data['latitude'].min()), float(data['latitude'].max())))
+            lon_range = st.slider("Longitud", -180.0, 180.0,
+                                  (float(data['longitude'].min()), float(data['longitude'].max())))
+            if st.button("Agregar área"):
+                added = add_to_selection(st.session_state.selected_ids, ids_in_bbox(data, lat_range, lon_range))
+                st.success(f"{added} mensajes agregados")
+
+# ----------------- Entity Filters -----------------
+@st.cache_data(ttl=60, show_spinner=False)
+def window_entities(ids):
+    # Entity counts for the messages in the dashboard window (index lookup only)
+    return top_entities(ids, limit=100)
+
+
+with st.sidebar:
+    with st.expander("Entidades"):
+        entities = window_entities(tuple(data['id'])) if not data.empty else pd.DataFrame()
+        if not entities.empty:
+            options = {
+                row.id: f"{row.text} ({row.label}) · {row.mentions}"
+                for row in entities.itertuples()
+            }
+            # Entities that left the window can no longer be offered
+            st.session_state.entity_filter = [e for e in st.session_state.entity_filter if e in options]
+            st.multiselect("Filtrar mapa por entidad", list(options),
+                           format_func=options.get, key="entity_filter")
+        else:
+            st.session_state.entity_filter = []
+            st.caption("Sin entidades indexadas en la ventana actual")
+
+        entity_query = st.text_input("Buscar entidad en todo el historial")
+        if st.button("Agregar menciones") and entity_query:
+            matches = find_messages(entity_query)
+            # Only messages still in SQLite can go into a selection/report
+            hot = indexed_message_ids(matches)
+            added = add_to_selection(st.session_state.selected_ids, hot)
+            st.success(f"{len(matches)} mensajes mencionan '{entity_query}'; {added} agregados")
+            if len(matches) > len(hot):
+                st.caption(f"{len(matches) - len(hot)} de ellos están archivados (ver Análisis Histórico)")
+
 # ----------------- Auto-Center -----------------
 if "map_center" not in st.session_state:
     flagged = data[data['flag'].isin(['alert', 'highlight', 'important'])] if 'flag' in data.columns else pd.DataFrame()
@@ -188,84 +309,143 @@ if "map_center" not in st.session_state:
             "lon": flagged.iloc[0]["longitude"]
         }
 
-# ----------------- Main Layout -----------------
-col1, col2 = st.columns([7, 3])
+# ----------------- Main Layout (live fragment) -----------------
+@st.fragment(run_every=LIVE_REFRESH_SECONDS if live_mode else None)
+def render_live_view():
+    # Only the map and the message panel rerun on the live interval
+    data = load_data()
 
-with col1:
-    st.subheader("🗺️ Mapa 3D de Mensajes")
-
-    if not data.empty:
-        center_lat = data["latitude"].mean()
-        center_lon = data["longitude"].mean()
-        if "map_center" in st.session_state:
-            center_lat = st.session_state.map_center["lat"]
-            center_lon = st.session_state.map_center["lon"]
-
-        zoom_level = st.session_state.map_zoom
-        adjusted_radius = base_radius * (2 ** (zoom_level - 10))
-
-        layer = pdk.Layer(
-            "ScatterplotLayer",
-            data=data,
-            get_position=["longitude", "latitude"],
-            get_radius=adjusted_radius,
-            get_fill_color=[255, 87, 51, int(point_opacity * 255)],
-            pickable=True,
-            radius_units="meters"
-        )
-
-        view_state = pdk.ViewState(
-            latitude=center_lat,
-            longitude=center_lon,
-            zoom=zoom_level,
-            pitch=45
-        )
-
-        r = pdk.Deck(
-            layers=[layer],
-            initial_view_state=view_state,
-            map_style=st.session_state.map_style,
-            tooltip={"text": "{location_name}\n{text}"}
-        )
-        st.pydeck_chart(r)
-    else:
-        st.warning("No hay datos para mostrar")
-
-with col2:
-    st.subheader("📩 Detalles del Mensaje")
     if not data.empty:
-        options = [f"{row['location_name']}: {row['text'][:30]}..." for _, row in data.iterrows()]
-        idx = st.selectbox("Selecciona un mensaje", options=range(len(options)), format_func=lambda i: options[i])
-        selected = data.iloc[idx]
-
-        st.markdown(f"**Ubicación:** {selected['location_name']}")
-        st.markdown(f"**Tiempo:** {selected['time_ago']}")
-        st.markdown(f"**Mensaje:**")
-        st.markdown(selected['text'])
-
-        render_media(selected.get('media_paths'))
-
-        if st.button("Agregar al Reporte"):
-            exists = any(p['id'] == selected['id'] for p in st.session_state.selected_points)
-            if not exists:
-                st.session_state.selected_points.append(selected.to_dict())
-                st.success("Agregado")
-            else:
-                st.warning("Ya está en la selección")
-
-        if st.button("Centrar en el Mapa"):
-            st.session_state.map_center = {
-                "lat": selected["latitude"],
-                "lon": selected["longitude"]
-            }
-            st.rerun()
-    else:
-        st.info("No hay mensajes disponibles")
-
-    if st.session_state.selected_points:
-        st.subheader(f"📝 Seleccionados ({len(st.session_state.selected_points)})")
-        for i, p in enumerate(st.session_state.selected_points):
-            st.markdown(f"{i+1}. **{p['location_name']}**: {p['text'][:50]}...")
+        latest_id = int(data['id'].max())
+        last_seen = st.session_state.get("live_last_seen_id")
+        if live_mode and last_seen is not None and latest_id > last_seen:
+            new_ids = data.loc[data['id'] > last_seen, 'id'].tolist()
+            st.session_state.live_new_ids.update(new_ids)
+            st.toast(f"{len(new_ids)} mensajes nuevos")
+        st.session_state.live_last_seen_id = latest_id
+
+    if st.session_state.entity_filter and not data.empty:
+        data = data[data['id'].isin(messages_for_entities(st.session_state.entity_filter))]
+
+    col1, col2 = st.columns([7, 3])
+
+    with col1:
+        st.subheader("🗺️ Mapa 3D de Mensajes")
+
+        if not data.empty:
+            center_lat = float(data["latitude"].mean())
+            center_lon = float(data["longitude"].mean())
+            if "map_center" in st.session_state:
+                center_lat = st.session_state.map_center["lat"]
+                center_lon = st.session_state.map_center["lon"]
+
+            zoom_level = st.session_state.map_zoom
+            adjusted_radius = base_radius * (2 ** (zoom_level - 10))
+
+            layer = pdk.Layer(
+                "ScatterplotLayer",
+                id="messages",
+                data=to_layer_records(data),
+                get_position=["longitude", "latitude"],
+                get_radius=adjusted_radius,
+                get_fill_color=[255, 87, 51, int(point_opacity * 255)],
+                pickable=True,
+                radius_units="meters"
+            )
+
+            # Points ingested since the user last acknowledged them
+            new_layers = []
+            new_points = data[data['id'].isin(st.session_state.live_new_ids)]
+            if not new_points.empty:
+                new_layers.append(pdk.Layer(
+                    "ScatterplotLayer",
+                    id="new_messages",
+                    data=to_layer_records(new_points),
+                    get_position=["longitude", "latitude"],
+                    get_radius=adjusted_radius * 1.5,
+                    get_fill_color=[0, 200, 255, 230],
+                    pickable=True,
+                    radius_units="meters"
+                ))
+
+            view_state = pdk.ViewState(
+                latitude=center_lat,
+                longitude=center_lon,
+                zoom=zoom_level,
+                pitch=45
+            )
+
+            r = pdk.Deck(
+                layers=[layer] + new_layers,
+                initial_view_state=view_state,
+                map_style=st.session_state.map_style,
+                tooltip={"text": "{location_name}\n{preview}"}
+            )
+            map_event = st.pydeck_chart(r, on_select="rerun", selection_mode="multi-object")
+
+            picked_ids = ids_from_map_selection(map_event, "messages")
+            if picked_ids and st.button(f"Agregar puntos seleccionados en el mapa ({len(picked_ids)})"):
+                added = add_to_selection(st.session_state.selected_ids, picked_ids)
+                st.success(f"{added} mensajes agregados")
+
+            if st.session_state.live_new_ids and st.button(f"Marcar como vistos ({len(st.session_state.live_new_ids)})"):
+                st.session_state.live_new_ids = set()
+                st.rerun(scope="fragment")
+        else:
+            st.warning("No hay datos para mostrar")
+
+    with col2:
+        st.subheader("📩 Detalles del Mensaje")
+        if not data.empty:
+            # Select by id so incoming messages do not shift the current choice
+            labels = dict(zip(
+                data['id'],
+                data['location_name'].astype(str) + ": " + data['preview'].str[:30] + "..."
+            ))
+            # The widget is rebuilt whenever the options change (live refresh), so the
+            # choice is kept in our own key and restored through index=
+            options = list(labels)
+            chosen = st.session_state.get("chosen_message_id")
+            selected_id = st.selectbox("Selecciona un mensaje", options=options,
+                                       index=options.index(chosen) if chosen in labels else 0,
+                                       format_func=labels.get)
+            st.session_state.chosen_message_id = int(selected_id)
+            selected = data.loc[data['id'] == selected_id].iloc[0]
+            # Full text and media are not part of the shared frame: one indexed lookup by id
+            details = fetch_messages_by_ids([selected_id])
+
+            st.markdown(f"**Ubicación:** {selected['location_name']}")
+            st.markdown(f"**Tiempo:** {humanize.naturaltime(datetime.now(timezone.utc) - selected['timestamp'])}")
+            st.markdown(f"**Mensaje:**")
+            if not details.empty:
+                st.markdown(details.iloc[0]['text'])
+                render_media(details.iloc[0]['media_paths'])
+
+            if st.button("Agregar al Reporte"):
+                if add_to_selection(st.session_state.selected_ids, [selected['id']]):
+                    st.success("Agregado")
+                else:
+                    st.warning("Ya está en la selección")
+
+            if st.button("Centrar en el Mapa"):
+                st.session_state.map_center = {
+                    "lat": float(selected["latitude"]),
+                    "lon": float(selected["longitude"])
+                }
+                st.rerun(scope="fragment")
+        else:
+            st.info("No hay mensajes disponibles")
+
+        if st.session_state.selected_ids:
+            st.subheader(f"📝 Seleccionados ({len(st.session_state.selected_ids)})")
+            preview = fetch_messages_by_ids(st.session_state.selected_ids, limit=20)
+            for i, p in enumerate(preview.itertuples()):
+                st.markdown(f"{i+1}. **{p.location_name}**: {(p.text or '')[:50]}...")
+            if len(st.session_state.selected_ids) > len(preview):
+                st.caption(f"... y {len(st.session_state.selected_ids) - len(preview)} más")
+
+
+render_live_view()
 
 # ----------------- Report Section -----------------
 if "report" in st.session_state and st.session_state.report:
@@ -286,3 +466,16 @@ if "report" in st.session_state and st.session_state.report:
     b64 = base64.b64encode(csv.encode()).decode()
     href = f'<a href="data:file/csv;base64,{b64}" download="telegram_report.csv">📥 Descargar CSV</a>'
     st.markdown(href, unsafe_allow_html=True)
+
+# ----------------- History Section -----------------
+if st.session_state.get("history_report"):
+    history = st.session_state.history_report
+    st.header("📈 Análisis Histórico")
+    st.markdown(f"**Periodo:** {history['date_range']}")
+    st.markdown(f"**Total de mensajes:** {history['total_messages']}")
+
+    st.subheader("Actividad por Canal")
+    st.plotly_chart(history['activity_fig'], use_container_width=True)
+
+    st.subheader("Ubicaciones más Mencionadas")
+    st.dataframe(history['top_locations'])
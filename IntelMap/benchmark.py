@@ -0,0 +1,110 @@
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import pydeck as pdk
+
+from data.synthetic_messages import generate_database
+from utils.archive_utils import daily_activity, top_locations
+from utils.coord_utils import extract_coordinates
+from utils.data_utils import prepare_dashboard_frame, query_dashboard_rows
+from utils.db_utils import fetch_messages_by_ids
+from utils.map_utils import to_layer_records
+from utils.report_utils import generate_report
+
+
+def _time(fn, repeat):
+    """Run fn `repeat` times and return (median seconds, last result)"""
+    timings, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def _resolve_coordinates_only(unplaced):
+    # Benchmarks must not hit the network: only the explicit-coordinate stage runs
+    resolved = {}
+    for row in unplaced.itertuples():
+        coordinates = extract_coordinates(row.text or "")
+        if coordinates:
+            c = coordinates[0]
+            resolved[row.id] = (c['lat'], c['lon'], c['name'])
+    return resolved
+
+
+def benchmark_scale(db_path, window_days, limit, report_size, repeat, archive_dir):
+    """
+    Time each dashboard stage against one database
+
+    Returns:
+        dict: Stage name -> median milliseconds
+    """
+    results = {}
+
+    elapsed, rows = _time(lambda: query_dashboard_rows(db_path, days=window_days, limit=limit), repeat)
+    results['query'] = elapsed
+
+    elapsed, frame = _time(lambda: prepare_dashboard_frame(rows.copy(), _resolve_coordinates_only), repeat)
+    results['post-processing'] = elapsed
+
+    def build_map():
+        layer = pdk.Layer("ScatterplotLayer", id="messages", data=to_layer_records(frame),
+                          get_position=["longitude", "latitude"], pickable=True)
+        return pdk.Deck(layers=[layer], initial_view_state=pdk.ViewState(latitude=48, longitude=35)).to_json()
+
+    elapsed, payload = _time(build_map, repeat)
+    results['map payload'] = elapsed
+
+    ids = frame['id'].head(report_size).tolist()
+    elapsed, _ = _time(lambda: generate_report(fetch_messages_by_ids(ids, db_path=db_path)), repeat)
+    results['report'] = elapsed
+
+    end = datetime.now(timezone.utc).date()
+    start = end - timedelta(days=90)
+    elapsed, _ = _time(lambda: (daily_activity(start, end, db_path=db_path, archive_dir=archive_dir),
+                                top_locations(start, end, db_path=db_path, archive_dir=archive_dir)), repeat)
+    results['history report'] = elapsed
+
+    return {name: seconds * 1000 for name, seconds in results.items()}, len(frame), len(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dashboard scalability benchmark on synthetic data")
+    parser.add_argument('--scales', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--days', type=int, default=30, help="Time span of the synthetic data")
+    parser.add_argument('--window-days', type=int, default=None,
+                        help="Dashboard time window (default: the whole --days span)")
+    parser.add_argument('--limit', type=int, default=None,
+                        help="Dashboard row limit (default: the scale, i.e. every row reaches the map)")
+    parser.add_argument('--report-size', type=int, default=None,
+                        help="Messages per report (default: the scale)")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--workdir', default=None, help="Keep generated databases here (reused if present)")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='intelmap-bench-')
+    archive_dir = os.path.join(workdir, 'archive')
+    os.makedirs(archive_dir, exist_ok=True)
+
+    stages = ['query', 'post-processing', 'map payload', 'report', 'history report']
+    print(f"{'rows':>10} {'shown':>6} {'payload KB':>10} " + " ".join(f"{s + ' ms':>18}" for s in stages))
+    for scale in args.scales:
+        db_path = os.path.join(workdir, f"synthetic_{scale}.db")
+        if not os.path.exists(db_path):
+            generate_database(db_path, scale, days=args.days)
+        # The map and report stages only grow with the data if the limits grow with it
+        timings, shown, payload_size = benchmark_scale(
+            db_path, args.window_days or args.days, args.limit or scale,
+            args.report_size or scale, args.repeat, archive_dir
+        )
+        print(f"{scale:>10} {shown:>6} {payload_size / 1024:>10.1f} "
+              + " ".join(f"{timings[s]:>18.1f}" for s in stages))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,4 @@
-from typing import List, Tuple, Union
+from typing import Dict, List, Tuple, Union
 import os
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -8,6 +8,9 @@ MAP_CENTER: Tuple[float, float] = (48.3794, 31.1656)
 DEFAULT_ZOOM: int = 5
 MAX_ENTRIES: int = 500
 
+# Intervalo de refresco del modo en vivo del dashboard (segundos)
+LIVE_REFRESH_SECONDS: int = 5
+
 # Canales de Telegram a monitorear
 CHANNELS: List[Union[str, int]] = [
     "Slavyangrad",
@@ -30,7 +33,42 @@ MONITOR_GROUP = -1002402693433
 MEDIA_DIR = os.path.join(BASE_DIR, 'media')
 DB_PATH = os.path.join(BASE_DIR, 'intel_data.db')
 LOG_DIR = os.path.join(BASE_DIR, 'logs')
+ARCHIVE_DIR = os.path.join(BASE_DIR, 'archive')
+GAZETTEER_DIR = os.path.join(BASE_DIR, 'data', 'gazetteers')
+
+# Modelos spaCy por idioma (se cargan bajo demanda; si faltan se usa el gazetteer)
+NER_MODELS: Dict[str, str] = {
+    'en': 'en_core_web_sm',
+    'ru': 'ru_core_news_sm',
+    'uk': 'uk_core_news_sm',
+    'xx': 'xx_ent_wiki_sm',
+}
+
+# Días que los mensajes permanecen en la base SQLite antes de archivarse
+HOT_RETENTION_DAYS: int = 3
+
+# Geocodificación: proveedores en orden de preferencia (servicios de geopy).
+# Para un Nominatim/Photon propio: {'name': 'local', 'service': 'photon',
+#   'options': {'domain': 'localhost:2322', 'scheme': 'http'}}
+# min_interval: segundos mínimos entre peticiones a ese proveedor, por proceso
+# (el Nominatim público admite 1 petición/s: con varios workers, multiplicar por su número)
+GEOCODERS: List[Dict] = [
+    {'name': 'nominatim', 'service': 'nominatim', 'options': {}, 'min_interval': 1.0},
+    {'name': 'photon', 'service': 'photon', 'options': {}, 'min_interval': 0.2},
+]
+GEOCODE_TIMEOUT: float = 5.0        # límite total por consulta (segundos)
+GEOCODE_HEDGE_DELAY: float = 0.8    # espera antes de lanzar el siguiente proveedor
+GEOCODE_BREAKER_THRESHOLD: int = 5  # fallos seguidos que abren el circuito
+GEOCODE_BREAKER_RESET: float = 30.0 # segundos hasta reintentar un proveedor abierto
+
+# Retención: presupuesto de disco para medios y política de filas expiradas
+MEDIA_BUDGET_BYTES: int = 5 * 1024 ** 3
+MEDIA_MAX_AGE_DAYS: int = 30
+THUMBNAIL_SIZE: int = 320
+RETENTION_MODE: str = 'archive'  # 'archive' (Parquet) o 'delete'
+RETENTION_INTERVAL_SECONDS: int = 3600
 
 # Crear directorios necesarios
 os.makedirs(MEDIA_DIR, exist_ok=True)
-os.makedirs(LOG_DIR, exist_ok=True)
\ No newline at end of file
+os.makedirs(LOG_DIR, exist_ok=True)
+os.makedirs(ARCHIVE_DIR, exist_ok=True)
\ No newline at end of file
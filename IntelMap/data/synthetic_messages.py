@@ -0,0 +1,169 @@
+import argparse
+import csv
+import os
+import random
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+from config import CHANNELS
+from utils.db_utils import init_schema
+
+# (name, lat, lon, weight): activity hotspots the synthetic points cluster around
+HOTSPOTS = [
+    ("Pokrovsk", 48.2827, 37.1758, 8),
+    ("Bakhmut", 48.5947, 37.9996, 6),
+    ("Kharkiv", 49.9935, 36.2304, 5),
+    ("Zaporizhzhia", 47.8388, 35.1396, 4),
+    ("Kherson", 46.6354, 32.6169, 4),
+    ("Kyiv", 50.4501, 30.5234, 3),
+    ("Odesa", 46.4825, 30.7233, 2),
+    ("Kursk", 51.7304, 36.1926, 2),
+    ("Gaza", 31.5017, 34.4668, 4),
+    ("Beirut", 33.8938, 35.5018, 2),
+    ("Damascus", 33.5138, 36.2765, 2),
+    ("Sanaa", 15.3694, 44.1910, 1),
+]
+
+TEMPLATES = [
+    "Reports of shelling near {place} this morning, several buildings damaged.",
+    "Drone activity observed over {place}. Air defense engaged.",
+    "Convoy spotted moving through {place} towards the front line.",
+    "Explosions heard in {place}, no official confirmation yet.",
+    "Power outages reported across {place} after overnight strikes.",
+    "Удар по {place}, есть пострадавшие.",
+    "Вибухи в районі {place}, працює ППО.",
+]
+
+
+def _channel_weights(channels):
+    # Zipf-like: a few channels produce most of the traffic
+    return [1 / (rank + 1) for rank in range(len(channels))]
+
+
+def load_hotspots(path):
+    """
+    Read hotspots from a CSV file with name, lat, lon and weight columns
+
+    Args:
+        path (str): CSV file (a header row is expected)
+
+    Returns:
+        list: (name, lat, lon, weight) tuples
+    """
+    with open(path, encoding='utf-8', newline='') as f:
+        return [(row['name'], float(row['lat']), float(row['lon']), float(row.get('weight') or 1))
+                for row in csv.DictReader(f)]
+
+
+def generate_database(db_path, n_messages, channels=None, days=30, duplicate_rate=0.1,
+                      media_ratio=0.3, unplaced_ratio=0.15, coordinate_ratio=0.05,
+                      spread_km=25.0, hotspots=None, seed=42):
+    """
+    Fill a SQLite database with realistic synthetic messages/locations rows
+
+    Args:
+        db_path (str): Database to create (overwritten if it exists)
+        n_messages (int): Number of messages to generate
+        channels (list, optional): Source channels (defaults to config.CHANNELS)
+        days (int): Time span covered, ending now
+        duplicate_rate (float): Share of messages that repost an earlier text in another channel
+        media_ratio (float): Share of messages with a media attachment
+        unplaced_ratio (float): Share of messages without a locations row
+        coordinate_ratio (float): Share of texts that contain explicit coordinates
+        spread_km (float): Standard deviation of the points around their hotspot
+        hotspots (list, optional): (name, lat, lon, weight) tuples (defaults to HOTSPOTS)
+        seed (int): Random seed
+
+    Returns:
+        str: Path of the generated database
+    """
+    rng = random.Random(seed)
+    channels = [str(c) for c in (channels or CHANNELS)]
+    weights = _channel_weights(channels)
+    hotspots = hotspots or HOTSPOTS
+    hotspot_weights = [h[3] for h in hotspots]
+    spread_deg = spread_km / 111.0
+    now = datetime.now(timezone.utc)
+
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    init_schema(conn)
+
+    messages, locations, recent_texts = [], [], []
+    location_id = 0
+    for msg_id in range(1, n_messages + 1):
+        channel = rng.choices(channels, weights)[0]
+        timestamp = now - timedelta(seconds=rng.random() * days * 86400)
+        name, h_lat, h_lon, _ = rng.choices(hotspots, hotspot_weights)[0]
+        lat = h_lat + rng.gauss(0, spread_deg)
+        lon = h_lon + rng.gauss(0, spread_deg)
+
+        if recent_texts and rng.random() < duplicate_rate:
+            text = rng.choice(recent_texts)
+        else:
+            text = rng.choice(TEMPLATES).format(place=name)
+            if rng.random() < coordinate_ratio:
+                text += f" Coordinates: {lat:.4f}, {lon:.4f}"
+            recent_texts.append(text)
+            if len(recent_texts) > 200:
+                recent_texts.pop(0)
+
+        media = ""
+        if rng.random() < media_ratio:
+            ext = '.mp4' if rng.random() < 0.3 else '.jpg'
+            media = f"{channel}_{msg_id}{ext}"
+
+        messages.append((msg_id, text, media, timestamp.strftime('%Y-%m-%d %H:%M:%S'), channel, msg_id))
+        if rng.random() >= unplaced_ratio:
+            location_id += 1
+            locations.append((location_id, msg_id, lat, lon, name, round(rng.uniform(0.5, 0.9), 2)))
+
+        if len(messages) >= 50000:
+            _flush(conn, messages, locations)
+
+    _flush(conn, messages, locations)
+    conn.execute('ANALYZE')
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def _flush(conn, messages, locations):
+    conn.executemany('''
+        INSERT INTO messages (id, text, media_paths, timestamp, source_channel, telegram_msg_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', messages)
+    conn.executemany('''
+        INSERT INTO locations (id, message_id, lat, lon, location_name, confidence)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', locations)
+    conn.commit()
+    messages.clear()
+    locations.clear()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic intel database")
+    parser.add_argument('db_path')
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--duplicate-rate', type=float, default=0.1)
+    parser.add_argument('--media-ratio', type=float, default=0.3)
+    parser.add_argument('--unplaced-ratio', type=float, default=0.15)
+    parser.add_argument('--coordinate-ratio', type=float, default=0.05)
+    parser.add_argument('--spread-km', type=float, default=25.0)
+    parser.add_argument('--channels', nargs='+', help="Source channels (defaults to config.CHANNELS)")
+    parser.add_argument('--hotspots', help="CSV file with name,lat,lon,weight columns")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    generate_database(args.db_path, args.messages, channels=args.channels, days=args.days,
+                      duplicate_rate=args.duplicate_rate, media_ratio=args.media_ratio,
+                      unplaced_ratio=args.unplaced_ratio, coordinate_ratio=args.coordinate_ratio,
+                      spread_km=args.spread_km,
+                      hotspots=load_hotspots(args.hotspots) if args.hotspots else None,
+                      seed=args.seed)
+    print(f"Generated {args.messages} messages in {args.db_path}")
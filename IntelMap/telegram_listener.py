@@ -1,14 +1,19 @@
+import argparse
 import asyncio
-import sqlite3
 import logging
+import multiprocessing
 import os
+import signal
+import time
 from datetime import datetime
 from telethon import TelegramClient, events
 from telethon.errors import FloodWaitError
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut, GeocoderUnavailable
-import spacy
-from config import CHANNELS, MONITOR_GROUP, MEDIA_DIR, DB_PATH, LOG_DIR
+from config import CHANNELS, MONITOR_GROUP, DB_PATH, LOG_DIR
+from utils.coord_utils import extract_coordinates, is_precise
+from utils.db_utils import BatchedWriter, connect, init_schema
+from utils.geocode_utils import GeocoderUnavailable, get_geocoder
+from utils.media_utils import make_thumbnail, shard_dir, to_relative
+from utils.nlp_utils import PLACE_LABELS, extract_entities
 import os
 from dotenv import load_dotenv
 
@@ -17,7 +22,7 @@ load_dotenv()
 # Configuración de logging
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    format='%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
         logging.FileHandler(os.path.join(LOG_DIR, 'listener.log')),
         logging.StreamHandler()
@@ -25,37 +30,15 @@ logging.basicConfig(
 )
 logger = logging.getLogger('TelegramListener')
 
-# Inicialización NLP y Geocoder
-nlp = spacy.load("en_core_web_sm")
-geolocator = Nominatim(user_agent="intel_map_app_v2")
-
-# Base de datos
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-c = conn.cursor()
-
-c.execute('''
-    CREATE TABLE IF NOT EXISTS messages (
-        id INTEGER PRIMARY KEY,
-        text TEXT NOT NULL,
-        media_paths TEXT,
-        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-        source_channel TEXT,
-        telegram_msg_id INTEGER
-    )
-''')
-
-c.execute('''
-    CREATE TABLE IF NOT EXISTS locations (
-        id INTEGER PRIMARY KEY,
-        message_id INTEGER,
-        lat REAL,
-        lon REAL,
-        location_name TEXT,
-        confidence REAL,
-        FOREIGN KEY(message_id) REFERENCES messages(id)
-    )
-''')
-conn.commit()
+# Geocodificador con varios proveedores (los modelos NER se cargan por idioma bajo demanda)
+geocoder = get_geocoder("intel_map_app_v2")
+
+# Supervisor: reinicios permitidos por worker antes de redistribuir sus canales
+MAX_RESTARTS = 5
+RESTART_WINDOW = 300  # segundos
+DEFAULT_SESSION = 'intel_map_session'
+# Segundos que un worker tiene para terminar mensajes en curso y vaciar el writer
+STOP_TIMEOUT = 20
 
 def extract_flags(text: str) -> list:
     """Extrae códigos de país de emojis de banderas"""
@@ -71,126 +54,152 @@ def extract_flags(text: str) -> list:
         i += 1
     return flags
 
-async def geocode_with_retry(location: str, country_code: str = None, retries=3) -> tuple:
-    """Geocodificación con reintentos y contexto de país"""
-    for attempt in range(retries):
-        try:
-            query = f"{location}, {country_code}" if country_code else location
-            result = geolocator.geocode(query, exactly_one=True)
-            if result:
-                logger.debug(f"Geocode success: {query} -> {result.latitude},{result.longitude}")
-                return (result.latitude, result.longitude), 0.9 - (0.2 * attempt)
-            return None, 0.0
-        except (GeocoderTimedOut, GeocoderUnavailable) as e:
-            logger.warning(f"Geocode attempt {attempt+1} failed: {e}")
-            await asyncio.sleep(2 ** attempt)
+async def geocode_location(location: str, country_code: str = None) -> tuple:
+    """Geocodificación con proveedores en carrera (hedging) y contexto de país"""
+    query = f"{location}, {country_code}" if country_code else location
+    try:
+        result, provider = await geocoder.geocode(query)
+    except GeocoderUnavailable as e:
+        logger.warning(f"{e}; the message can be re-geocoded later with entity_utils reresolve")
+        return None, 0.0
+    if result:
+        logger.debug(f"Geocode success ({provider}): {query} -> {result.latitude},{result.longitude}")
+        return (result.latitude, result.longitude), 0.9
     return None, 0.0
 
 async def process_message(message):
-    """Procesa un mensaje y extrae ubicaciones"""
+    """Procesa un mensaje y extrae ubicaciones y entidades"""
     try:
         text = message.text or ""
         logger.info(f"Processing message: {text[:50]}...")
         
+        # Coordenadas explícitas: exactas, sin geocodificación
+        # Las entidades se indexan siempre, también en mensajes con coordenadas
+        coordinates = extract_coordinates(text)
+        entities = extract_entities(text)
+        if is_precise(coordinates):
+            logger.info(f"Found {len(coordinates)} explicit coordinates, skipping geocoding")
+            return coordinates, entities
+        # Pares de baja precisión (solo con palabra clave) no sustituyen al geocoding
+        
         flags = extract_flags(text)
-        doc = nlp(text)
-        locations = [ent.text for ent in doc.ents if ent.label_ in ['GPE', 'LOC']]
         
-        results = []
+        # Un lugar mencionado varias veces se geocodifica una sola vez
+        places = {}
+        for i, ent in enumerate(entities):
+            if ent['label'] in PLACE_LABELS and ent['normalized']:
+                places.setdefault(ent['normalized'], i)
         
-        for loc in locations:
+        async def resolve(index):
+            loc = entities[index]['lemma']
             best_coords = None
             best_confidence = 0.0
             
             # Intentar con códigos de país primero
             for cc in flags:
-                coords, confidence = await geocode_with_retry(loc, cc)
+                coords, confidence = await geocode_location(loc, cc)
                 if confidence > best_confidence:
                     best_coords = coords
                     best_confidence = confidence
             
             # Si no se encontró con bandera, intentar sin
             if not best_coords:
-                coords, confidence = await geocode_with_retry(loc)
+                coords, confidence = await geocode_location(loc)
                 if confidence > best_confidence:
                     best_coords = coords
                     best_confidence = confidence
             
             if best_coords:
-                results.append({
+                return {
                     'name': loc,
                     'lat': best_coords[0],
                     'lon': best_coords[1],
-                    'confidence': best_confidence
-                })
+                    'confidence': best_confidence,
+                    'entity': index
+                }
+            return None
         
-        return results
+        # Las entidades se geocodifican en paralelo
+        resolved = await asyncio.gather(*(resolve(i) for i in places.values()))
+        located = [r for r in resolved if r]
+        # Los pares de baja precisión solo se guardan si ningún lugar se resolvió
+        return located or coordinates, entities
     except Exception as e:
         logger.error(f"Error processing message: {str(e)}")
-        return []
+        return [], []
 
-async def main():
+async def main(channels=CHANNELS, session_name=DEFAULT_SESSION):
     """Función principal del listener"""
+    conn = connect(DB_PATH)
+    init_schema(conn)
+    writer = BatchedWriter(conn)
+    in_flight = set()
+
     client = TelegramClient(
-        'intel_map_session',
+        session_name,
         int(os.getenv('API_ID')),
         os.getenv('API_HASH')
     )
     
     try:
         await client.start()
-        logger.info("Client started successfully")
+        logger.info(f"Client started successfully ({len(channels)} channels)")
+        writer.start()
+        target_entity = await client.get_entity(MONITOR_GROUP)
         
-        @client.on(events.NewMessage(chats=CHANNELS))
+        # SIGTERM (supervisor, systemd): desconectar en vez de morir, así el finally
+        # espera a los mensajes en curso y vacía el writer
+        try:
+            asyncio.get_running_loop().add_signal_handler(
+                signal.SIGTERM, lambda: asyncio.ensure_future(client.disconnect())
+            )
+        except NotImplementedError:  # Windows
+            pass
+        
+        @client.on(events.NewMessage(chats=channels))
         async def handler(event):
+            task = asyncio.current_task()
+            in_flight.add(task)
             try:
                 start_time = datetime.now()
                 logger.info(f"New message from {event.chat_id}")
                 
-                # Guardar en DB primero
                 media_paths = []
                 if event.message.media:
                     filename = f"{event.chat_id}_{event.message.id}"
                     path = await event.message.download_media(
-                        file=os.path.join(MEDIA_DIR, filename)
+                        file=os.path.join(shard_dir(filename), filename)
                     )
-                    media_paths.append(path)
-                    logger.debug(f"Media saved: {path}")
+                    if path:
+                        try:
+                            make_thumbnail(path)
+                        except Exception as e:
+                            logger.warning(f"Thumbnail failed for {path}: {e}")
+                        media_paths.append(to_relative(path))
+                        logger.debug(f"Media saved: {path}")
+                
+                # Procesamiento de ubicaciones
+                locations, entities = await process_message(event.message)
                 
-                c.execute('''
-                    INSERT INTO messages 
-                    (text, media_paths, source_channel, telegram_msg_id)
-                    VALUES (?, ?, ?, ?)
-                ''', (
+                # Guardar antes del forward: un FloodWaitError no debe perder el mensaje.
+                # El mensaje, sus ubicaciones y sus entidades se guardan juntos en el siguiente lote
+                writer.submit(
                     event.message.text,
                     ','.join(media_paths),
                     str(event.chat_id),
-                    event.message.id
-                ))
-                msg_id = c.lastrowid
-                conn.commit()
-                logger.debug(f"Message saved to DB: ID {msg_id}")
+                    event.message.id,
+                    locations,
+                    entities
+                )
                 
                 # Forward al grupo privado
-                target_entity = await client.get_entity(MONITOR_GROUP)
-                await event.message.forward_to(target_entity)
-                logger.info(f"Message {msg_id} forwarded to monitor group")
-                
-                # Procesamiento de ubicaciones
-                locations = await process_message(event.message)
-                for loc in locations:
-                    c.execute('''
-                        INSERT INTO locations 
-                        (message_id, lat, lon, location_name, confidence)
-                        VALUES (?, ?, ?, ?, ?)
-                    ''', (
-                        msg_id,
-                        loc['lat'],
-                        loc['lon'],
-                        loc['name'],
-                        loc['confidence']
-                    ))
-                conn.commit()
+                try:
+                    await event.message.forward_to(target_entity)
+                    logger.info(f"Message {event.message.id} forwarded to monitor group")
+                except FloodWaitError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Error forwarding message: {str(e)}")
                 
                 logger.info(f"Processing completed in {datetime.now() - start_time}")
                 
@@ -199,17 +208,118 @@ async def main():
                 await asyncio.sleep(e.seconds)
             except Exception as e:
                 logger.error(f"Error handling message: {str(e)}")
-                conn.rollback()
+            finally:
+                in_flight.discard(task)
         
         logger.info("Starting listener...")
         await client.run_until_disconnected()
         
     except Exception as e:
         logger.critical(f"Fatal error: {str(e)}")
+        raise
     finally:
+        if in_flight:
+            logger.info(f"Waiting for {len(in_flight)} messages in progress")
+            await asyncio.wait(in_flight, timeout=STOP_TIMEOUT / 2)
+        await writer.close()
         await client.disconnect()
         conn.close()
         logger.info("Shutdown complete")
 
+def partition_channels(channels, num_workers):
+    """Reparte los canales entre workers por round-robin"""
+    num_workers = max(1, min(num_workers, len(channels)))
+    return [list(channels[i::num_workers]) for i in range(num_workers)]
+
+def run_worker(channels, session_name):
+    """Punto de entrada de cada proceso worker"""
+    asyncio.run(main(channels, session_name))
+
+async def authorize_sessions(session_names):
+    """Inicia sesión en cada archivo de sesión antes de lanzar los workers.
+
+    Los workers no tienen stdin, así que el login interactivo (teléfono,
+    código, 2FA) debe hacerse aquí la primera vez.
+    """
+    for name in session_names:
+        client = TelegramClient(name, int(os.getenv('API_ID')), os.getenv('API_HASH'))
+        await client.start()
+        await client.disconnect()
+
+def stop_workers(procs):
+    """Pide a los workers que terminen (SIGTERM, vacían su writer) y mata los que no lo hagan a tiempo"""
+    procs = list(procs)
+    for proc in procs:
+        proc.terminate()
+    deadline = time.monotonic() + STOP_TIMEOUT
+    for proc in procs:
+        proc.join(max(0, deadline - time.monotonic()))
+        if proc.is_alive():
+            logger.warning(f"Worker {proc.name} did not stop in {STOP_TIMEOUT} s, killing it")
+            proc.kill()
+            proc.join()
+
+def supervise(num_workers):
+    """Lanza un worker por grupo de canales, los reinicia si caen y
+    redistribuye los canales de un worker que falla repetidamente"""
+    slots = [f"{DEFAULT_SESSION}_{i}" for i in range(max(1, min(num_workers, len(CHANNELS))))]
+    asyncio.run(authorize_sessions(slots))
+
+    def spawn(session_name, channels):
+        proc = multiprocessing.Process(
+            target=run_worker, args=(channels, session_name), name=session_name, daemon=True
+        )
+        proc.start()
+        logger.info(f"Worker {session_name} started (pid {proc.pid}): {channels}")
+        return proc
+
+    assignment = dict(zip(slots, partition_channels(CHANNELS, len(slots))))
+    workers = {name: spawn(name, chans) for name, chans in assignment.items()}
+    crashes = {name: [] for name in slots}
+    # Slots waiting out their backoff: name -> monotonic time of the restart
+    restart_at = {}
+
+    try:
+        while True:
+            time.sleep(1)
+            now = time.monotonic()
+            for name, due in list(restart_at.items()):
+                if now >= due:
+                    del restart_at[name]
+                    workers[name] = spawn(name, assignment[name])
+
+            for name, proc in list(workers.items()):
+                if name in restart_at or proc.is_alive():
+                    continue
+                crashes[name] = [t for t in crashes[name] if now - t < RESTART_WINDOW] + [now]
+                logger.warning(f"Worker {name} exited with code {proc.exitcode}")
+
+                if len(crashes[name]) > MAX_RESTARTS and len(workers) > 1:
+                    # Retirar el worker inestable y repartir sus canales entre el resto
+                    logger.error(f"Worker {name} keeps crashing, rebalancing its channels")
+                    del workers[name]
+                    restart_at.clear()
+                    stop_workers(workers.values())
+                    assignment = dict(zip(workers, partition_channels(CHANNELS, len(workers))))
+                    workers = {n: spawn(n, chans) for n, chans in assignment.items()}
+                    break
+
+                # Backoff sin bloquear la vigilancia de los demás workers
+                delay = min(2 ** len(crashes[name]), 60)
+                logger.info(f"Restarting worker {name} in {delay} s")
+                restart_at[name] = now + delay
+    except KeyboardInterrupt:
+        logger.info("Stopping workers...")
+    finally:
+        stop_workers(workers.values())
+
 if __name__ == '__main__':
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Telegram listener")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Número de procesos worker (canales repartidos entre ellos)")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        supervise(args.workers)
+    else:
+        asyncio.run(main())
@@ -0,0 +1,374 @@
+import argparse
+import logging
+import os
+import re
+import sqlite3
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from config import ARCHIVE_DIR, DB_PATH, HOT_RETENTION_DAYS
+from utils.db_utils import init_schema
+
+try:
+    import duckdb
+except ImportError:  # DuckDB is optional, Arrow covers the built-in analytics
+    duckdb = None
+
+logger = logging.getLogger('Archive')
+
+MESSAGES_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('text', pa.string()),
+    ('media_paths', pa.string()),
+    ('timestamp', pa.timestamp('s', tz='UTC')),
+    ('source_channel', pa.string()),
+    ('telegram_msg_id', pa.int64()),
+])
+
+LOCATIONS_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('message_id', pa.int64()),
+    ('lat', pa.float64()),
+    ('lon', pa.float64()),
+    ('location_name', pa.string()),
+    ('confidence', pa.float64()),
+])
+
+# Entity mentions of archived messages; the entities themselves stay in SQLite
+MESSAGE_ENTITIES_SCHEMA = pa.schema([
+    ('message_id', pa.int64()),
+    ('entity_id', pa.int64()),
+    ('start_char', pa.int64()),
+    ('end_char', pa.int64()),
+    ('text', pa.string()),
+])
+
+SCHEMAS = {
+    'messages': MESSAGES_SCHEMA,
+    'locations': LOCATIONS_SCHEMA,
+    'message_entities': MESSAGE_ENTITIES_SCHEMA,
+}
+# Columns identifying a row, used to drop duplicates left by interrupted runs
+_KEYS = {
+    'messages': ['id'],
+    'locations': ['id'],
+    'message_entities': ['message_id', 'entity_id', 'start_char'],
+}
+
+# Partition values are always read back as strings (channel ids look numeric)
+PARTITIONING = ds.partitioning(
+    pa.schema([('date', pa.string()), ('channel', pa.string())]),
+    flavor='hive'
+)
+
+
+def _partition_dir(archive_dir, table, date, channel):
+    channel = re.sub(r'[^\w\-]', '_', channel or 'unknown')
+    return os.path.join(archive_dir, table, f"date={date}", f"channel={channel}")
+
+
+def _write_partitions(df, schema, table, archive_dir):
+    """Write a frame carrying _date/_channel helper columns as one file per partition"""
+    for (date, channel), part in df.groupby(['_date', '_channel'], dropna=False):
+        directory = _partition_dir(archive_dir, table, date, channel)
+        os.makedirs(directory, exist_ok=True)
+        arrow_table = pa.Table.from_pandas(
+            part[schema.names], schema=schema, preserve_index=False
+        )
+        pq.write_table(arrow_table, os.path.join(directory, f"part-{uuid.uuid4().hex}.parquet"))
+
+
+# Messages of one day (start inclusive, next day exclusive) that are past the cutoff
+_DAY_FILTER = 'timestamp >= ? AND timestamp < ? AND timestamp <= ?'
+
+
+def _archive_day(conn, archive_dir, day, next_day, cutoff):
+    """Archive then delete one day of expired messages in a single transaction"""
+    params = [day, next_day, cutoff]
+    expired = f"SELECT id FROM messages WHERE {_DAY_FILTER}"
+    messages = pd.read_sql(f"SELECT * FROM messages WHERE {_DAY_FILTER}", conn, params=params)
+    if messages.empty:
+        return 0
+    locations = pd.read_sql(f'''
+        SELECT l.*, m.timestamp AS _timestamp, m.source_channel AS _channel
+        FROM locations l
+        JOIN messages m ON m.id = l.message_id
+        WHERE m.id IN ({expired})
+    ''', conn, params=params)
+    mentions = pd.read_sql(f'''
+        SELECT me.*, m.timestamp AS _timestamp, m.source_channel AS _channel
+        FROM message_entities me
+        JOIN messages m ON m.id = me.message_id
+        WHERE m.id IN ({expired})
+    ''', conn, params=params)
+
+    messages['timestamp'] = pd.to_datetime(messages['timestamp'], utc=True)
+    messages['_date'] = messages['timestamp'].dt.strftime('%Y-%m-%d')
+    messages['_channel'] = messages['source_channel'].fillna('unknown')
+    _write_partitions(messages, MESSAGES_SCHEMA, 'messages', archive_dir)
+
+    for table, related in (('locations', locations), ('message_entities', mentions)):
+        if not related.empty:
+            related['_date'] = pd.to_datetime(related['_timestamp'], utc=True).dt.strftime('%Y-%m-%d')
+            related['_channel'] = related['_channel'].fillna('unknown')
+            _write_partitions(related, SCHEMAS[table], table, archive_dir)
+
+    conn.execute(f"DELETE FROM locations WHERE message_id IN ({expired})", params)
+    conn.execute(f"DELETE FROM message_entities WHERE message_id IN ({expired})", params)
+    conn.execute(f"DELETE FROM messages WHERE {_DAY_FILTER}", params)
+    conn.commit()
+    return len(messages)
+
+
+def archive_old_rows(db_path=DB_PATH, archive_dir=ARCHIVE_DIR, days=HOT_RETENTION_DAYS):
+    """
+    Move messages older than `days` (with their locations and entity mentions) to the Parquet archive
+
+    The entities themselves stay in SQLite, so archived mentions keep
+    pointing at valid ids and entity searches can cover the archive.
+
+    Rows are moved one day at a time, so the first run on a large database
+    never holds more than a day of messages in memory. Each day's files are
+    written before its rows are deleted, so an interrupted run can only leave
+    duplicates behind, which compact_archive removes.
+
+    Args:
+        db_path (str): Path to the hot SQLite database
+        archive_dir (str): Root directory of the archive
+        days (int): Age in days after which messages leave SQLite
+
+    Returns:
+        int: Number of archived messages
+    """
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+
+    total = 0
+    with sqlite3.connect(db_path) as conn:
+        init_schema(conn)
+        day_starts = [row[0] for row in conn.execute(
+            "SELECT DISTINCT date(timestamp) FROM messages WHERE timestamp <= ? ORDER BY 1", (cutoff,)
+        )]
+        for day in day_starts:
+            # Same text format as the stored timestamps, so the range uses idx_messages_timestamp
+            next_day = (datetime.strptime(day, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+            count = _archive_day(conn, archive_dir, day, next_day, cutoff)
+            total += count
+            logger.info(f"Archived {count} messages from {day}")
+
+    logger.info(f"Archived {total} messages older than {cutoff}")
+    return total
+
+
+def compact_archive(archive_dir=ARCHIVE_DIR):
+    """
+    Merge the files of every archive partition into a single deduplicated file
+
+    Args:
+        archive_dir (str): Root directory of the archive
+
+    Returns:
+        int: Number of partitions rewritten
+    """
+    compacted = 0
+    for table, schema in SCHEMAS.items():
+        root = os.path.join(archive_dir, table)
+        for directory, _, files in os.walk(root):
+            parts = sorted(f for f in files if f.endswith('.parquet'))
+            if len(parts) < 2:
+                continue
+            paths = [os.path.join(directory, f) for f in parts]
+            merged = pa.concat_tables([pq.read_table(p, schema=schema) for p in paths])
+            keys = _KEYS[table]
+            df = merged.to_pandas().drop_duplicates(subset=keys, keep='last').sort_values(keys)
+            tmp_path = os.path.join(directory, f".compact-{uuid.uuid4().hex}.tmp")
+            pq.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False), tmp_path)
+            os.replace(tmp_path, os.path.join(directory, f"part-{uuid.uuid4().hex}.parquet"))
+            for path in paths:
+                os.remove(path)
+            compacted += 1
+    logger.info(f"Compacted {compacted} archive partitions")
+    return compacted
+
+
+def archive_dataset(table, archive_dir=ARCHIVE_DIR):
+    """
+    Open an archive table as a partitioned Arrow dataset
+
+    Args:
+        table (str): 'messages', 'locations' or 'message_entities'
+        archive_dir (str): Root directory of the archive
+
+    Returns:
+        pyarrow.dataset.Dataset or None: The dataset, or None if nothing is archived yet
+    """
+    root = os.path.join(archive_dir, table)
+    if not os.path.isdir(root):
+        return None
+    dataset = ds.dataset(root, format='parquet', partitioning=PARTITIONING,
+                         schema=pa.unify_schemas([SCHEMAS[table], PARTITIONING.schema]))
+    return dataset if dataset.files else None
+
+
+def _partition_filter(start=None, end=None, channels=None):
+    expr = None
+    clauses = []
+    if start is not None:
+        clauses.append(ds.field('date') >= pd.Timestamp(start).strftime('%Y-%m-%d'))
+    if end is not None:
+        clauses.append(ds.field('date') <= pd.Timestamp(end).strftime('%Y-%m-%d'))
+    if channels:
+        clauses.append(ds.field('channel').isin([str(c) for c in channels]))
+    for clause in clauses:
+        expr = clause if expr is None else expr & clause
+    return expr
+
+
+def load_archive(table, start=None, end=None, channels=None, columns=None, archive_dir=ARCHIVE_DIR):
+    """
+    Read archived rows, pruning partitions by date and channel
+
+    Args:
+        table (str): 'messages', 'locations' or 'message_entities'
+        start (date, optional): First day to include
+        end (date, optional): Last day to include
+        channels (list, optional): Source channels to include
+        columns (list, optional): Columns to read (partition columns date/channel allowed)
+        archive_dir (str): Root directory of the archive
+
+    Returns:
+        pyarrow.Table: Matching rows (empty if nothing is archived)
+    """
+    dataset = archive_dataset(table, archive_dir)
+    if dataset is None:
+        schema = pa.unify_schemas([SCHEMAS[table], PARTITIONING.schema])
+        empty = schema.empty_table()
+        return empty.select(columns) if columns else empty
+    return dataset.to_table(columns=columns, filter=_partition_filter(start, end, channels))
+
+
+def query_archive(sql, params=None, archive_dir=ARCHIVE_DIR):
+    """
+    Run an analytical SQL query over the archive with DuckDB
+
+    The archive is exposed as the views `archive_messages`,
+    `archive_locations` and `archive_message_entities`, all with extra
+    `date` and `channel` columns.
+
+    Args:
+        sql (str): DuckDB SQL query
+        params (list, optional): Query parameters
+        archive_dir (str): Root directory of the archive
+
+    Returns:
+        pd.DataFrame: Query result
+    """
+    if duckdb is None:
+        raise RuntimeError("DuckDB no está instalado; usa load_archive para consultas Arrow")
+    con = duckdb.connect()
+    try:
+        for table in SCHEMAS:
+            dataset = archive_dataset(table, archive_dir)
+            if dataset is None:
+                dataset = load_archive(table, archive_dir=archive_dir)
+            con.register(f"archive_{table}", dataset)
+        return con.execute(sql, params or []).df()
+    finally:
+        con.close()
+
+
+def daily_activity(start, end, db_path=DB_PATH, archive_dir=ARCHIVE_DIR):
+    """
+    Count messages per day and channel across the archive and the hot database
+
+    Args:
+        start (date): First day to include
+        end (date): Last day to include
+        db_path (str): Path to the hot SQLite database
+        archive_dir (str): Root directory of the archive
+
+    Returns:
+        pd.DataFrame: Columns date, channel, messages
+    """
+    archived = (
+        load_archive('messages', start, end, columns=['date', 'channel', 'id'], archive_dir=archive_dir)
+        .group_by(['date', 'channel'])
+        .aggregate([('id', 'count')])
+        .to_pandas()
+        .rename(columns={'id_count': 'messages'})
+    )
+
+    with sqlite3.connect(db_path) as conn:
+        hot = pd.read_sql('''
+            SELECT date(timestamp) AS date,
+                   COALESCE(source_channel, 'unknown') AS channel,
+                   COUNT(*) AS messages
+            FROM messages
+            WHERE date(timestamp) BETWEEN ? AND ?
+            GROUP BY 1, 2
+        ''', conn, params=[pd.Timestamp(start).strftime('%Y-%m-%d'),
+                           pd.Timestamp(end).strftime('%Y-%m-%d')])
+
+    combined = pd.concat([archived, hot], ignore_index=True)
+    if combined.empty:
+        return pd.DataFrame(columns=['date', 'channel', 'messages'])
+    return combined.groupby(['date', 'channel'], as_index=False)['messages'].sum().sort_values('date')
+
+
+def top_locations(start, end, limit=20, db_path=DB_PATH, archive_dir=ARCHIVE_DIR):
+    """
+    Rank location names by number of mentions across the archive and the hot database
+
+    Args:
+        start (date): First day to include
+        end (date): Last day to include
+        limit (int): Number of locations to return
+        db_path (str): Path to the hot SQLite database
+        archive_dir (str): Root directory of the archive
+
+    Returns:
+        pd.DataFrame: Columns location_name, mentions
+    """
+    archived = (
+        load_archive('locations', start, end, columns=['location_name', 'id'], archive_dir=archive_dir)
+        .group_by(['location_name'])
+        .aggregate([('id', 'count')])
+        .to_pandas()
+        .rename(columns={'id_count': 'mentions'})
+    )
+
+    with sqlite3.connect(db_path) as conn:
+        hot = pd.read_sql('''
+            SELECT l.location_name, COUNT(*) AS mentions
+            FROM locations l
+            JOIN messages m ON m.id = l.message_id
+            WHERE date(m.timestamp) BETWEEN ? AND ?
+            GROUP BY 1
+        ''', conn, params=[pd.Timestamp(start).strftime('%Y-%m-%d'),
+                           pd.Timestamp(end).strftime('%Y-%m-%d')])
+
+    combined = pd.concat([archived, hot], ignore_index=True).dropna(subset=['location_name'])
+    if combined.empty:
+        return pd.DataFrame(columns=['location_name', 'mentions'])
+    return (
+        combined.groupby('location_name', as_index=False)['mentions'].sum()
+        .sort_values('mentions', ascending=False)
+        .head(limit)
+    )
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Move aged rows from SQLite to the Parquet archive")
+    parser.add_argument('--days', type=int, default=HOT_RETENTION_DAYS)
+    parser.add_argument('--no-compact', action='store_true')
+    args = parser.parse_args()
+
+    archive_old_rows(days=args.days)
+    if not args.no_compact:
+        compact_archive()
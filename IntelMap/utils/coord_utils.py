@@ -0,0 +1,302 @@
+import math
+import re
+from urllib.parse import unquote
+
+# Explicit coordinates are exact, unlike geocoded place names
+COORD_CONFIDENCE = 1.0
+# Short decimal pairs only count next to a cue word and may still be times/dates/prices
+LOW_PRECISION_CONFIDENCE = 0.6
+# Decimals a bare "lat, lon" pair needs to be taken without a cue (~10 m)
+MIN_DECIMALS = 4
+
+# ----------------- Precompiled patterns -----------------
+
+_URL_RE = re.compile(r"https?://\S+", re.IGNORECASE)
+_NUM = r"([-+]?\d{1,3}\.\d+)"
+_GOOGLE_AT_RE = re.compile(r"@" + _NUM + r"," + _NUM)
+_GOOGLE_PARAM_RE = re.compile(r"[?&](?:q|ll|query|center|destination)=(?:loc:)?" + _NUM + r"\s*,\s*" + _NUM)
+_YANDEX_PARAM_RE = re.compile(r"[?&](?:ll|pt|whatshere\[point\])=" + _NUM + r"," + _NUM)
+_OSM_MAP_RE = re.compile(r"#map=\d+/" + _NUM + r"/" + _NUM)
+_OSM_MARKER_RE = re.compile(r"[?&]mlat=" + _NUM + r"&mlon=" + _NUM)
+
+_MGRS_RE = re.compile(
+    r"\b(\d{1,2})([C-HJ-NP-X])\s?([A-HJ-NP-Z])([A-HJ-NP-V])\s?(\d{1,5})\s?(\d{1,5})?\b"
+)
+
+_DMS_PART = (
+    r"(\d{1,3}(?:\.\d+)?)\s*°\s*"
+    r"(?:(\d{1,2}(?:\.\d+)?)\s*['′’]\s*)?"
+    r"(?:(\d{1,2}(?:\.\d+)?)\s*(?:\"|″|''|”)\s*)?"
+    r"([NSEWСЮВЗ])"
+)
+_DMS_RE = re.compile(_DMS_PART + r"[\s,;]+" + _DMS_PART, re.IGNORECASE)
+
+_DECIMAL_RE = re.compile(
+    r"(?<![\w.])([-+]?\d{1,2}\.(\d{2,}))°?\s*,\s*([-+]?\d{1,3}\.(\d{2,}))°?(?![\w.])"
+)
+# Words (or a degree sign) that mark a nearby decimal pair as coordinates
+_COORD_CUE_RE = re.compile(r"\b(?:coord\w*|координат\w*|gps|lat|lon)\b|°", re.IGNORECASE)
+_CUE_WINDOW = 40
+
+# Decimal degrees tagged with hemispheres: "48.59N 37.99E", "N48.59 E37.99".
+# Case-sensitive so Cyrillic prepositions ("с", "в") are not taken for hemispheres
+_HEMI_SUFFIX_RE = re.compile(
+    r"(?<![\w.])(\d{1,2}\.\d+)°?\s?([NSСЮ])[\s,;]+(\d{1,3}\.\d+)°?\s?([EWВЗ])(?!\w)"
+)
+_HEMI_PREFIX_RE = re.compile(
+    r"(?<!\w)([NSСЮ])(\d{1,2}\.\d+)°?[\s,;]+([EWВЗ])(\d{1,3}\.\d+)°?(?![\w.])"
+)
+
+# Cyrillic hemisphere letters used by Russian/Ukrainian channels
+_HEMISPHERES = {'N': 'N', 'S': 'S', 'E': 'E', 'W': 'W', 'С': 'N', 'Ю': 'S', 'В': 'E', 'З': 'W'}
+
+
+def _valid(lat, lon):
+    return -90 <= lat <= 90 and -180 <= lon <= 180 and not (lat == 0 and lon == 0)
+
+
+# ----------------- MGRS -----------------
+
+_WGS84_A = 6378137.0
+_WGS84_F = 1 / 298.257223563
+_UTM_K0 = 0.9996
+_MGRS_COLUMNS = ('ABCDEFGH', 'JKLMNPQR', 'STUVWXYZ')
+_MGRS_ROWS = 'ABCDEFGHJKLMNPQRSTUV'
+_MGRS_BANDS = 'CDEFGHJKLMNPQRSTUVWX'
+
+
+def utm_to_latlon(zone, easting, northing, northern=True):
+    """
+    Convert WGS84 UTM coordinates to latitude/longitude
+
+    Args:
+        zone (int): UTM zone number (1-60)
+        easting (float): Easting in meters
+        northing (float): Northing in meters
+        northern (bool): Whether the point is in the northern hemisphere
+
+    Returns:
+        tuple: (lat, lon) in decimal degrees
+    """
+    e2 = _WGS84_F * (2 - _WGS84_F)
+    ep2 = e2 / (1 - e2)
+    e1 = (1 - math.sqrt(1 - e2)) / (1 + math.sqrt(1 - e2))
+
+    x = easting - 500000.0
+    y = northing if northern else northing - 10000000.0
+
+    mu = (y / _UTM_K0) / (_WGS84_A * (1 - e2 / 4 - 3 * e2 ** 2 / 64 - 5 * e2 ** 3 / 256))
+    phi1 = (
+        mu
+        + (3 * e1 / 2 - 27 * e1 ** 3 / 32) * math.sin(2 * mu)
+        + (21 * e1 ** 2 / 16 - 55 * e1 ** 4 / 32) * math.sin(4 * mu)
+        + (151 * e1 ** 3 / 96) * math.sin(6 * mu)
+        + (1097 * e1 ** 4 / 512) * math.sin(8 * mu)
+    )
+
+    sin_phi, cos_phi, tan_phi = math.sin(phi1), math.cos(phi1), math.tan(phi1)
+    n1 = _WGS84_A / math.sqrt(1 - e2 * sin_phi ** 2)
+    t1 = tan_phi ** 2
+    c1 = ep2 * cos_phi ** 2
+    r1 = _WGS84_A * (1 - e2) / (1 - e2 * sin_phi ** 2) ** 1.5
+    d = x / (n1 * _UTM_K0)
+
+    lat = phi1 - (n1 * tan_phi / r1) * (
+        d ** 2 / 2
+        - (5 + 3 * t1 + 10 * c1 - 4 * c1 ** 2 - 9 * ep2) * d ** 4 / 24
+        + (61 + 90 * t1 + 298 * c1 + 45 * t1 ** 2 - 252 * ep2 - 3 * c1 ** 2) * d ** 6 / 720
+    )
+    lon = (
+        d
+        - (1 + 2 * t1 + c1) * d ** 3 / 6
+        + (5 - 2 * c1 + 28 * t1 - 3 * c1 ** 2 + 8 * ep2 + 24 * t1 ** 2) * d ** 5 / 120
+    ) / cos_phi
+
+    lon0 = (zone - 1) * 6 - 180 + 3
+    return math.degrees(lat), lon0 + math.degrees(lon)
+
+
+def mgrs_to_latlon(zone, band, column, row, digits):
+    """
+    Convert an MGRS grid reference to the latitude/longitude of the square's centre
+
+    Args:
+        zone (int): UTM zone number
+        band (str): Latitude band letter (C-X)
+        column (str): 100 km square column letter
+        row (str): 100 km square row letter
+        digits (str): Even number of easting+northing digits
+
+    Returns:
+        tuple or None: (lat, lon), or None if the reference is invalid
+    """
+    band, column, row = band.upper(), column.upper(), row.upper()
+    if not 1 <= zone <= 60 or len(digits) % 2 or band not in _MGRS_BANDS:
+        return None
+    columns = _MGRS_COLUMNS[(zone - 1) % 3]
+    if column not in columns:
+        return None
+
+    precision = len(digits) // 2
+    scale = 10 ** (5 - precision)
+    easting = (columns.index(column) + 1) * 100000 + int(digits[:precision]) * scale + scale / 2
+    row_index = (_MGRS_ROWS.index(row) - (5 if zone % 2 == 0 else 0)) % 20
+    northing = row_index * 100000 + int(digits[precision:]) * scale + scale / 2
+
+    # The row letter repeats every 2000 km: pick the cycle that lands inside the band
+    band_south = -80 + _MGRS_BANDS.index(band) * 8
+    band_north = band_south + (12 if band == 'X' else 8)
+    northern = band >= 'N'
+    for cycle in range(5):
+        candidate = northing + cycle * 2000000
+        lat, lon = utm_to_latlon(zone, easting, candidate, northern)
+        if band_south - 0.5 <= lat <= band_north + 0.5:
+            return lat, lon
+    return None
+
+
+# ----------------- Extraction -----------------
+
+def _from_links(text):
+    for match in _URL_RE.finditer(text):
+        url = unquote(match.group(0))
+        host = url.lower()
+        coords = None
+        if 'google.' in host or 'goo.gl' in host:
+            found = _GOOGLE_AT_RE.search(url) or _GOOGLE_PARAM_RE.search(url)
+            if found:
+                coords = float(found.group(1)), float(found.group(2))
+        elif 'yandex.' in host:
+            found = _YANDEX_PARAM_RE.search(url)
+            if found:
+                # Yandex puts longitude first
+                coords = float(found.group(2)), float(found.group(1))
+        elif 'openstreetmap.org' in host:
+            found = _OSM_MARKER_RE.search(url) or _OSM_MAP_RE.search(url)
+            if found:
+                coords = float(found.group(1)), float(found.group(2))
+        if coords:
+            # Links make poor location names, use the coordinates instead
+            yield match.span(), f"{coords[0]:.5f}, {coords[1]:.5f}", coords, COORD_CONFIDENCE
+
+
+def _from_mgrs(text):
+    for match in _MGRS_RE.finditer(text):
+        zone, band, column, row, first, second = match.groups()
+        digits = first + (second or '')
+        if second and len(first) != len(second):
+            continue
+        if len(digits) < 4:
+            continue
+        coords = mgrs_to_latlon(int(zone), band, column, row, digits)
+        if coords:
+            yield match.span(), match.group(0), coords, COORD_CONFIDENCE
+
+
+def _dms_value(degrees, minutes, seconds, hemisphere):
+    value = float(degrees) + float(minutes or 0) / 60 + float(seconds or 0) / 3600
+    return -value if hemisphere in ('S', 'W') else value
+
+
+def _from_dms(text):
+    for match in _DMS_RE.finditer(text):
+        groups = match.groups()
+        first_h = _HEMISPHERES[groups[3].upper()]
+        second_h = _HEMISPHERES[groups[7].upper()]
+        first = _dms_value(*groups[:3], first_h)
+        second = _dms_value(*groups[4:7], second_h)
+        if first_h in 'NS' and second_h in 'EW':
+            coords = first, second
+        elif first_h in 'EW' and second_h in 'NS':
+            coords = second, first
+        else:
+            continue
+        yield match.span(), match.group(0), coords, COORD_CONFIDENCE
+
+
+def _from_hemisphere_decimal(text):
+    for match in _HEMI_SUFFIX_RE.finditer(text):
+        lat, lat_h, lon, lon_h = match.groups()
+        yield match.span(), match.group(0), (
+            _dms_value(lat, None, None, _HEMISPHERES[lat_h]),
+            _dms_value(lon, None, None, _HEMISPHERES[lon_h]),
+        ), COORD_CONFIDENCE
+    for match in _HEMI_PREFIX_RE.finditer(text):
+        lat_h, lat, lon_h, lon = match.groups()
+        yield match.span(), match.group(0), (
+            _dms_value(lat, None, None, _HEMISPHERES[lat_h]),
+            _dms_value(lon, None, None, _HEMISPHERES[lon_h]),
+        ), COORD_CONFIDENCE
+
+
+def _from_decimal(text):
+    # Two-decimal pairs are as often times ("10.30, 12.45"), dd.mm dates or
+    # prices, so without enough decimals a cue word must be close by
+    for match in _DECIMAL_RE.finditer(text):
+        lat, lat_decimals, lon, lon_decimals = match.groups()
+        if min(len(lat_decimals), len(lon_decimals)) >= MIN_DECIMALS:
+            confidence = COORD_CONFIDENCE
+        else:
+            start, end = match.span()
+            if not _COORD_CUE_RE.search(text[max(0, start - _CUE_WINDOW):end]):
+                continue
+            confidence = LOW_PRECISION_CONFIDENCE
+        yield match.span(), match.group(0), (float(lat), float(lon)), confidence
+
+
+def extract_coordinates(text):
+    """
+    Extract explicit coordinates from a message
+
+    Recognises map links (Google, Yandex, OpenStreetMap), MGRS grid
+    references, degree/minute/second notation, hemisphere-tagged decimal
+    degrees and decimal "lat, lon" pairs. Each match is masked before the
+    next, more generic, pattern runs so the same coordinates are never
+    reported twice.
+
+    Decimal pairs need MIN_DECIMALS decimals, or a cue word such as
+    "координаты" nearby, in which case they get LOW_PRECISION_CONFIDENCE
+    and should not stop NER on the message.
+
+    Args:
+        text (str): Message text
+
+    Returns:
+        list: Dicts with name, lat, lon and confidence (same shape as process_message results)
+    """
+    if not text:
+        return []
+
+    results = []
+    seen = set()
+    working = text
+    for extractor in (_from_links, _from_mgrs, _from_dms, _from_hemisphere_decimal, _from_decimal):
+        spans = []
+        for span, raw, (lat, lon), confidence in extractor(working):
+            spans.append(span)
+            key = (round(lat, 4), round(lon, 4))
+            if not _valid(lat, lon) or key in seen:
+                continue
+            seen.add(key)
+            results.append({
+                'name': raw.strip(),
+                'lat': lat,
+                'lon': lon,
+                'confidence': confidence
+            })
+        for start, end in spans:
+            working = working[:start] + ' ' * (end - start) + working[end:]
+    return results
+
+
+def is_precise(coordinates):
+    """
+    Whether extracted coordinates are reliable enough to skip NER/geocoding
+
+    Args:
+        coordinates (list): Results of extract_coordinates
+
+    Returns:
+        bool: True if at least one match has full confidence
+    """
+    return any(c['confidence'] >= COORD_CONFIDENCE for c in coordinates)
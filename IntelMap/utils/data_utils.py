@@ -3,6 +3,8 @@ import streamlit as st
 from datetime import datetime
 import random
 import os
+import sqlite3
+from config import DB_PATH, HOT_RETENTION_DAYS, MAX_ENTRIES
 from data.sample_messages import get_sample_messages
 
 def load_data():
@@ -90,3 +92,100 @@ def process_telegram_data(telegram_data):
     # Add any necessary transformations here
     
     return df
+
+def compact_dashboard_frame(df):
+    """
+    Convert the dashboard frame to a compact, read-only friendly layout
+    
+    Repeated strings become categoricals, coordinates float32 and the text
+    preview an Arrow-backed string. Full message text and media paths are not
+    kept in the frame; they are fetched by id when a message is displayed.
+    
+    Args:
+        df (pd.DataFrame): Frame built by the dashboard loader
+        
+    Returns:
+        pd.DataFrame: Compact frame with columns id, timestamp, source_channel,
+            location_name, latitude, longitude and preview
+    """
+    compact = pd.DataFrame({
+        'id': df['id'].astype('int64'),
+        'timestamp': df['timestamp'],
+        'source_channel': df['source_channel'].astype('category'),
+        'location_name': df['location_name'].astype('category'),
+        'latitude': df['latitude'].astype('float32'),
+        'longitude': df['longitude'].astype('float32'),
+        'preview': df['preview'].fillna("").astype('string[pyarrow]'),
+    })
+    return compact.reset_index(drop=True)
+
+def query_dashboard_rows(db_path=DB_PATH, days=HOT_RETENTION_DAYS, limit=MAX_ENTRIES):
+    """
+    Query the latest messages with their location for the dashboard
+    
+    Args:
+        db_path (str): Path to the SQLite database
+        days (int): Size of the time window in days
+        limit (int): Maximum number of messages
+        
+    Returns:
+        pd.DataFrame: One row per message; full text only for unplaced rows
+    """
+    query = '''
+        SELECT DISTINCT
+            m.id, m.timestamp, m.source_channel,
+            substr(m.text, 1, 80) AS preview,
+            -- Full text only for rows that need the fallback NER
+            CASE WHEN l.lat IS NULL OR l.lon IS NULL THEN m.text END AS text,
+            l.lat AS latitude, l.lon AS longitude, 
+            COALESCE(l.location_name, 'Ubicación desconocida') AS location_name
+        FROM messages m
+        LEFT JOIN locations l ON m.id = l.message_id
+        WHERE m.timestamp > datetime('now', ?)
+        GROUP BY m.id
+        ORDER BY m.timestamp DESC
+        LIMIT ?
+    '''
+    with sqlite3.connect(db_path) as conn:
+        return pd.read_sql(query, conn, params=[f'-{int(days)} days', int(limit)])
+
+def prepare_dashboard_frame(df, resolve_unplaced=None):
+    """
+    Clean the dashboard rows, place unplaced messages and compact the result
+    
+    Args:
+        df (pd.DataFrame): Rows from query_dashboard_rows
+        resolve_unplaced (Callable, optional): Receives the unplaced rows and returns
+            a mapping of message id to (lat, lon, location_name) or None
+            
+    Returns:
+        pd.DataFrame: Compact frame (see compact_dashboard_frame)
+    """
+    if df.empty:
+        return compact_dashboard_frame(df)
+
+    df = df[
+        (df['latitude'].between(-90, 90)) & 
+        (df['longitude'].between(-180, 180)) |
+        (df['latitude'].isna()) |
+        (df['longitude'].isna())
+    ].copy()
+
+    df['timestamp'] = pd.to_datetime(df['timestamp'], utc=True)
+    df['location_name'] = df['location_name'].str.title()
+
+    if resolve_unplaced is not None:
+        unplaced = df[df['latitude'].isna() | df['longitude'].isna()]
+        resolved_by_id = resolve_unplaced(unplaced)
+        for i, msg_id in unplaced['id'].items():
+            resolved = resolved_by_id.get(msg_id)
+            if resolved:
+                df.loc[i, ['latitude', 'longitude', 'location_name']] = resolved
+
+    # Drop rows that still have no valid coordinates
+    df = df[
+        (df['latitude'].notna()) & (df['longitude'].notna()) &
+        (df['latitude'].between(-90, 90)) & (df['longitude'].between(-180, 180))
+    ]
+
+    return compact_dashboard_frame(df)
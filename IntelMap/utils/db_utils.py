@@ -0,0 +1,320 @@
+import asyncio
+import json
+import logging
+import sqlite3
+
+import pandas as pd
+
+from config import DB_PATH
+
+logger = logging.getLogger('BatchedWriter')
+
+
+def connect(db_path=DB_PATH):
+    """
+    Open a connection configured for several concurrent writer processes
+
+    Args:
+        db_path (str): Path to the SQLite database
+
+    Returns:
+        sqlite3.Connection: Connection in WAL mode with a busy timeout
+    """
+    conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+def init_schema(conn):
+    """
+    Create the messages/locations/entities tables and their indexes if missing
+
+    `entities` holds one row per distinct (normalized text, label) and
+    `message_entities` is its inverted index: every mention with its span in
+    the message. Locations produced from an entity keep its id, so they can
+    be re-resolved without running NER again.
+
+    Args:
+        conn (sqlite3.Connection): Open connection to the intel database
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY,
+            text TEXT NOT NULL,
+            media_paths TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            source_channel TEXT,
+            telegram_msg_id INTEGER
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS locations (
+            id INTEGER PRIMARY KEY,
+            message_id INTEGER,
+            lat REAL,
+            lon REAL,
+            location_name TEXT,
+            confidence REAL,
+            FOREIGN KEY(message_id) REFERENCES messages(id)
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS entities (
+            id INTEGER PRIMARY KEY,
+            text TEXT NOT NULL,
+            label TEXT NOT NULL,
+            normalized TEXT NOT NULL,
+            lang TEXT,
+            UNIQUE(normalized, label)
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS message_entities (
+            message_id INTEGER NOT NULL,
+            entity_id INTEGER NOT NULL,
+            start_char INTEGER NOT NULL,
+            end_char INTEGER NOT NULL,
+            text TEXT,
+            PRIMARY KEY(message_id, entity_id, start_char),
+            FOREIGN KEY(message_id) REFERENCES messages(id),
+            FOREIGN KEY(entity_id) REFERENCES entities(id)
+        )
+    ''')
+
+    # Databases created before the entity index lack the link column
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(locations)')}
+    if 'entity_id' not in columns:
+        conn.execute('ALTER TABLE locations ADD COLUMN entity_id INTEGER REFERENCES entities(id)')
+
+    # Reports and the dashboard join locations by message id
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_locations_message_id ON locations(message_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp)')
+    # Entity lookups go entity -> messages; re-resolution goes entity -> locations
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_message_entities_entity ON message_entities(entity_id, message_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_locations_entity ON locations(entity_id)')
+    conn.commit()
+
+
+def fetch_messages_by_ids(ids, db_path=DB_PATH, limit=None):
+    """
+    Fetch messages (with their best location) for a set of message ids
+
+    The ids are passed as a single JSON array and expanded with json_each,
+    so the whole selection is resolved in one indexed query regardless of
+    its size.
+
+    Args:
+        ids (Iterable[int]): Message ids to fetch
+        db_path (str): Path to the SQLite database
+        limit (int, optional): Maximum number of rows to return
+
+    Returns:
+        pd.DataFrame: One row per message, newest first
+    """
+    ids = [int(i) for i in ids]
+    columns = ['id', 'text', 'timestamp', 'media_paths', 'source_channel',
+               'latitude', 'longitude', 'location_name']
+    if not ids:
+        return pd.DataFrame(columns=columns)
+
+    query = '''
+        SELECT
+            m.id, m.text, m.timestamp, m.media_paths, m.source_channel,
+            l.lat AS latitude, l.lon AS longitude,
+            COALESCE(l.location_name, 'Ubicación desconocida') AS location_name
+        FROM json_each(?) AS sel
+        JOIN messages m ON m.id = sel.value
+        LEFT JOIN locations l ON l.message_id = m.id
+        GROUP BY m.id
+        ORDER BY m.timestamp DESC
+    '''
+    params = [json.dumps(ids)]
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(int(limit))
+
+    with sqlite3.connect(db_path) as conn:
+        df = pd.read_sql(query, conn, params=params)
+
+    df['timestamp'] = pd.to_datetime(df['timestamp'], utc=True)
+    df['location_name'] = df['location_name'].str.title()
+    return df
+
+
+def search_message_ids(query, ids, db_path=DB_PATH):
+    """
+    Find which of the given messages contain a text (case-insensitive)
+
+    Args:
+        query (str): Text to look for
+        ids (Iterable[int]): Message ids to search within
+        db_path (str): Path to the SQLite database
+
+    Returns:
+        list: Matching message ids
+    """
+    ids = [int(i) for i in ids]
+    query = (query or "").strip()
+    if not ids or not query:
+        return []
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute('''
+            SELECT m.id, m.text
+            FROM json_each(?) AS sel
+            JOIN messages m ON m.id = sel.value
+        ''', (json.dumps(ids),)).fetchall()
+    # SQLite's lower()/LIKE only fold ASCII; casefold handles Cyrillic too
+    needle = query.casefold()
+    return [msg_id for msg_id, text in rows if needle in (text or "").casefold()]
+
+def store_entities(conn, message_id, entities):
+    """
+    Add a message's entities to the entity index
+
+    Runs inside the caller's transaction.
+
+    Args:
+        conn (sqlite3.Connection): Open connection
+        message_id (int): Message the entities were extracted from
+        entities (list): Dicts with text, lemma, label, start, end, lang and
+            normalized (as returned by nlp_utils.extract_entities); the entity
+            row keeps the lemma, each mention the text as written
+
+    Returns:
+        list: Entity id for each input entity, in order
+    """
+    entity_ids = []
+    for ent in entities:
+        conn.execute('''
+            INSERT OR IGNORE INTO entities (text, label, normalized, lang)
+            VALUES (?, ?, ?, ?)
+        ''', (ent.get('lemma', ent['text']), ent['label'], ent['normalized'], ent.get('lang')))
+        entity_id = conn.execute(
+            'SELECT id FROM entities WHERE normalized = ? AND label = ?',
+            (ent['normalized'], ent['label'])
+        ).fetchone()[0]
+        entity_ids.append(entity_id)
+    conn.executemany('''
+        INSERT OR IGNORE INTO message_entities (message_id, entity_id, start_char, end_char, text)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(message_id, entity_id, ent['start'], ent['end'], ent['text'])
+          for entity_id, ent in zip(entity_ids, entities)])
+    return entity_ids
+
+
+class BatchedWriter:
+    """
+    Buffer processed messages and write them to SQLite in batched transactions
+
+    A message, its locations and its entities are always written in the same transaction,
+    and each flush commits once for the whole batch, which keeps lock time
+    short when several listener processes share the database.
+    """
+
+    def __init__(self, conn, batch_size=50, flush_interval=1.0):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    def start(self):
+        """Start the periodic flush task on the running event loop"""
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def submit(self, text, media_paths, source_channel, telegram_msg_id, locations=(), entities=()):
+        """
+        Queue a message, its locations and its entities for the next flush
+
+        Args:
+            text (str): Message text
+            media_paths (str): Comma-separated media file names
+            source_channel (str): Channel the message came from
+            telegram_msg_id (int): Telegram message id
+            locations (list): Dicts with name, lat, lon and confidence; an
+                optional 'entity' key is the index of the entity it came from
+            entities (list): Entity dicts from nlp_utils.extract_entities
+        """
+        self._pending.append(((text, media_paths, source_channel, telegram_msg_id),
+                              list(locations), list(entities)))
+        if len(self._pending) >= self.batch_size:
+            asyncio.get_running_loop().create_task(self.flush())
+
+    def _write(self, batch):
+        with self.conn:
+            for row, locations, entities in batch:
+                cur = self.conn.execute('''
+                    INSERT INTO messages
+                    (text, media_paths, source_channel, telegram_msg_id)
+                    VALUES (?, ?, ?, ?)
+                ''', row)
+                msg_id = cur.lastrowid
+                entity_ids = store_entities(self.conn, msg_id, entities)
+                self.conn.executemany('''
+                    INSERT INTO locations
+                    (message_id, lat, lon, location_name, confidence, entity_id)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', [(msg_id, loc['lat'], loc['lon'], loc['name'], loc['confidence'],
+                       entity_ids[loc['entity']] if loc.get('entity') is not None else None)
+                      for loc in locations])
+
+    def _write_each(self, batch):
+        written, retry = 0, []
+        for item in batch:
+            try:
+                self._write([item])
+                written += 1
+            except sqlite3.OperationalError:
+                retry.append(item)
+            except sqlite3.Error as e:
+                (text, _, source_channel, telegram_msg_id), _, _ = item
+                logger.error(f"Dropping message {telegram_msg_id} from {source_channel} ({e}): "
+                             f"{(text or '')[:100]!r}")
+        return written, retry
+
+    async def flush(self):
+        """
+        Write every queued message in a single transaction
+
+        Returns:
+            int: Number of messages written
+        """
+        async with self._lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, []
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except sqlite3.OperationalError as e:
+                # Keep the batch for the next attempt (database locked/busy)
+                self._pending[:0] = batch
+                logger.warning(f"Batch write failed, will retry: {e}")
+                return 0
+            except sqlite3.Error as e:
+                # A bad row (e.g. a constraint violation) must not block the rest
+                logger.warning(f"Batch write failed ({e}), writing messages one by one")
+                written, retry = await asyncio.to_thread(self._write_each, batch)
+                self._pending[:0] = retry
+                return written
+            logger.debug(f"Flushed {len(batch)} messages")
+            return len(batch)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def close(self):
+        """Stop the periodic task and flush what is left"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
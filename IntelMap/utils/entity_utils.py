@@ -0,0 +1,355 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import sqlite3
+
+import pandas as pd
+import pyarrow.dataset as ds
+
+from config import ARCHIVE_DIR, DB_PATH, GAZETTEER_DIR
+from utils.archive_utils import archive_dataset
+from utils.db_utils import connect, init_schema, store_entities
+from utils.geocode_utils import GeocoderUnavailable, get_geocoder
+from utils.nlp_utils import PLACE_LABELS, extract_entities_batch, normalize_entity
+
+logger = logging.getLogger('Entities')
+
+# Manual place fixes: normalized name -> coordinates, applied before any geocoder
+OVERRIDES_PATH = os.path.join(GAZETTEER_DIR, 'overrides.csv')
+
+# A mention still needs a location unless its message already has one for that
+# entity, or one not tied to any entity (explicit coordinates, pre-index rows)
+_UNPLACED_MENTION = '''NOT EXISTS (
+    SELECT 1 FROM locations l
+    WHERE l.message_id = me.message_id
+      AND (l.entity_id = me.entity_id OR l.entity_id IS NULL)
+)'''
+
+
+def find_messages(query, label=None, include_archive=True, db_path=DB_PATH, archive_dir=ARCHIVE_DIR):
+    """
+    Get every message that mentions an entity
+
+    The query is normalized like the stored entities, so the lookup is an
+    index seek on entities(normalized, label) followed by the inverted index.
+    Mentions of archived messages are read from the Parquet archive.
+
+    Args:
+        query (str): Entity text, e.g. "Pokrovsk"
+        label (str, optional): Restrict to one NER label (e.g. 'GPE')
+        include_archive (bool): Also search the mentions of archived messages
+        db_path (str): Path to the SQLite database
+        archive_dir (str): Root directory of the archive
+
+    Returns:
+        list: Message ids, newest first
+    """
+    normalized = normalize_entity(query)
+    if not normalized:
+        return []
+    sql = 'SELECT id FROM entities WHERE normalized = ?'
+    params = [normalized]
+    if label:
+        sql += ' AND label = ?'
+        params.append(label)
+    with sqlite3.connect(db_path) as conn:
+        entity_ids = [row[0] for row in conn.execute(sql, params)]
+        if not entity_ids:
+            return []
+        found = {row[0] for row in conn.execute('''
+            SELECT DISTINCT me.message_id
+            FROM json_each(?) AS sel
+            JOIN message_entities me ON me.entity_id = sel.value
+        ''', (json.dumps(entity_ids),))}
+
+    dataset = archive_dataset('message_entities', archive_dir) if include_archive else None
+    if dataset is not None:
+        archived = dataset.to_table(columns=['message_id'], filter=ds.field('entity_id').isin(entity_ids))
+        found.update(archived.column('message_id').to_pylist())
+    return sorted(found, reverse=True)
+
+
+def messages_for_entities(entity_ids, db_path=DB_PATH):
+    """
+    Get the messages that mention any of the given entities
+
+    Args:
+        entity_ids (Iterable[int]): Entity ids
+        db_path (str): Path to the SQLite database
+
+    Returns:
+        set: Message ids
+    """
+    entity_ids = [int(i) for i in entity_ids]
+    if not entity_ids:
+        return set()
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute('''
+            SELECT DISTINCT me.message_id
+            FROM json_each(?) AS sel
+            JOIN message_entities me ON me.entity_id = sel.value
+        ''', (json.dumps(entity_ids),)).fetchall()
+    return {row[0] for row in rows}
+
+
+def top_entities(message_ids, labels=None, limit=50, db_path=DB_PATH):
+    """
+    Count the entities mentioned in a set of messages
+
+    Args:
+        message_ids (Iterable[int]): Messages to look at (e.g. the dashboard window)
+        labels (Iterable[str], optional): Only count these NER labels
+        limit (int): Maximum number of entities to return
+        db_path (str): Path to the SQLite database
+
+    Returns:
+        pd.DataFrame: id, text, label and mentions (number of messages), most mentioned first
+    """
+    message_ids = [int(i) for i in message_ids]
+    columns = ['id', 'text', 'label', 'mentions']
+    if not message_ids:
+        return pd.DataFrame(columns=columns)
+    sql = '''
+        SELECT e.id, e.text, e.label, COUNT(DISTINCT me.message_id) AS mentions
+        FROM json_each(?) AS sel
+        JOIN message_entities me ON me.message_id = sel.value
+        JOIN entities e ON e.id = me.entity_id
+    '''
+    params = [json.dumps(message_ids)]
+    if labels:
+        labels = list(labels)
+        sql += f" WHERE e.label IN ({','.join('?' * len(labels))})"
+        params.extend(labels)
+    sql += ' GROUP BY e.id ORDER BY mentions DESC, e.text LIMIT ?'
+    params.append(int(limit))
+    with sqlite3.connect(db_path) as conn:
+        return pd.read_sql(sql, conn, params=params)
+
+
+def places_for_messages(message_ids, db_path=DB_PATH):
+    """
+    Get the stored place entities of each message, in order of appearance
+
+    Lets the dashboard fallback geocode unplaced messages without running NER.
+
+    Args:
+        message_ids (Iterable[int]): Message ids
+        db_path (str): Path to the SQLite database
+
+    Returns:
+        dict: message id -> list of place texts (messages without place entities are absent)
+    """
+    message_ids = [int(i) for i in message_ids]
+    if not message_ids:
+        return {}
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute(f'''
+            SELECT me.message_id, e.text
+            FROM json_each(?) AS sel
+            JOIN message_entities me ON me.message_id = sel.value
+            JOIN entities e ON e.id = me.entity_id
+            WHERE e.label IN ({','.join('?' * len(PLACE_LABELS))})
+            ORDER BY me.message_id, me.start_char
+        ''', [json.dumps(message_ids), *PLACE_LABELS]).fetchall()
+    places = {}
+    for msg_id, text in rows:
+        names = places.setdefault(msg_id, [])
+        if text not in names:
+            names.append(text)
+    return places
+
+
+def indexed_message_ids(message_ids, db_path=DB_PATH):
+    """
+    Get which of the given messages already have entities in the index
+
+    Args:
+        message_ids (Iterable[int]): Message ids
+        db_path (str): Path to the SQLite database
+
+    Returns:
+        set: Message ids with at least one indexed entity
+    """
+    message_ids = [int(i) for i in message_ids]
+    if not message_ids:
+        return set()
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute('''
+            SELECT sel.value
+            FROM json_each(?) AS sel
+            WHERE EXISTS (SELECT 1 FROM message_entities me WHERE me.message_id = sel.value)
+        ''', (json.dumps(message_ids),)).fetchall()
+    return {row[0] for row in rows}
+
+
+def backfill(db_path=DB_PATH, batch_size=500):
+    """
+    Index the entities of messages stored before the entity index existed
+
+    This is the only entity job that runs NER. Messages without any entity
+    are looked at again on every run. Existing locations are linked to the
+    entity with the same normalized name in their message.
+
+    Args:
+        db_path (str): Path to the SQLite database
+        batch_size (int): Messages processed per transaction
+
+    Returns:
+        int: Number of messages indexed
+    """
+    conn = connect(db_path)
+    init_schema(conn)
+    indexed, last_id = 0, 0
+    try:
+        while True:
+            rows = conn.execute('''
+                SELECT m.id, m.text FROM messages m
+                WHERE m.id > ?
+                  AND NOT EXISTS (SELECT 1 FROM message_entities me WHERE me.message_id = m.id)
+                ORDER BY m.id LIMIT ?
+            ''', (last_id, batch_size)).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            extracted = extract_entities_batch([text or "" for _, text in rows])
+            with conn:
+                for (msg_id, _), entities in zip(rows, extracted):
+                    if not entities:
+                        continue
+                    entity_ids = store_entities(conn, msg_id, entities)
+                    by_name = {ent['normalized']: entity_id for ent, entity_id in zip(entities, entity_ids)
+                               if ent['label'] in PLACE_LABELS}
+                    for loc_id, name in conn.execute(
+                        'SELECT id, location_name FROM locations WHERE message_id = ? AND entity_id IS NULL',
+                        (msg_id,)
+                    ).fetchall():
+                        entity_id = by_name.get(normalize_entity(name))
+                        if entity_id is not None:
+                            conn.execute('UPDATE locations SET entity_id = ? WHERE id = ?', (entity_id, loc_id))
+                    indexed += 1
+            logger.info(f"Indexed entities up to message {last_id}")
+    finally:
+        conn.close()
+    logger.info(f"Backfilled entities for {indexed} messages")
+    return indexed
+
+
+def load_overrides(path=OVERRIDES_PATH):
+    """
+    Read manual coordinates for place names
+
+    The CSV has a header and the columns name, lat, lon.
+
+    Args:
+        path (str): Overrides file
+
+    Returns:
+        dict: normalized name -> (lat, lon)
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8', newline='') as f:
+        return {
+            normalize_entity(row['name']): (float(row['lat']), float(row['lon']))
+            for row in csv.DictReader(f)
+            if row.get('name')
+        }
+
+
+def reresolve(names=None, db_path=DB_PATH, geocoder=None, overrides=None):
+    """
+    Re-geocode place entities from the index and update `locations`
+
+    No NER runs here: the messages to update come from message_entities.
+    Without `names`, only entities listed in the overrides file and place
+    entities with a mention still lacking a location are resolved, so the
+    country-hinted results of the listener are not overwritten by accident.
+
+    Args:
+        names (Iterable[str], optional): Place names to re-resolve unconditionally
+        db_path (str): Path to the SQLite database
+        geocoder (HedgedGeocoder, optional): Geocoder for names without override
+        overrides (dict, optional): normalized name -> (lat, lon), defaults to load_overrides()
+
+    Returns:
+        int: Number of location rows updated or inserted
+    """
+    overrides = load_overrides() if overrides is None else overrides
+    placeholders = ','.join('?' * len(PLACE_LABELS))
+    conn = connect(db_path)
+    init_schema(conn)
+    try:
+        if names:
+            targets = [normalize_entity(n) for n in names]
+            entities = conn.execute(f'''
+                SELECT e.id, e.text, e.normalized FROM json_each(?) AS sel
+                JOIN entities e ON e.normalized = sel.value
+                WHERE e.label IN ({placeholders})
+            ''', [json.dumps(targets), *PLACE_LABELS]).fetchall()
+        else:
+            entities = conn.execute(f'''
+                SELECT e.id, e.text, e.normalized FROM entities e
+                WHERE e.label IN ({placeholders})
+                  AND (e.normalized IN (SELECT value FROM json_each(?))
+                       OR EXISTS (
+                           SELECT 1 FROM message_entities me
+                           WHERE me.entity_id = e.id AND {_UNPLACED_MENTION}
+                       ))
+            ''', [*PLACE_LABELS, json.dumps(list(overrides))]).fetchall()
+
+        changed = 0
+        for entity_id, text, normalized in entities:
+            if normalized in overrides:
+                (lat, lon), name, confidence = overrides[normalized], text, 1.0
+            else:
+                geocoder = geocoder or get_geocoder("intel_map_reresolve")
+                try:
+                    location, _ = geocoder.geocode_blocking(text)
+                except GeocoderUnavailable as e:
+                    logger.warning(f"{e}, skipped")
+                    continue
+                if location is None:
+                    logger.info(f"No result for '{text}'")
+                    continue
+                lat, lon, name, confidence = location.latitude, location.longitude, text, 0.9
+
+            with conn:
+                changed += conn.execute('''
+                    UPDATE locations SET lat = ?, lon = ?, location_name = ?, confidence = ?
+                    WHERE entity_id = ?
+                ''', (lat, lon, name, confidence, entity_id)).rowcount
+                changed += conn.execute(f'''
+                    INSERT INTO locations (message_id, lat, lon, location_name, confidence, entity_id)
+                    SELECT DISTINCT me.message_id, ?, ?, ?, ?, me.entity_id
+                    FROM message_entities me
+                    WHERE me.entity_id = ? AND {_UNPLACED_MENTION}
+                ''', (lat, lon, name, confidence, entity_id)).rowcount
+            logger.info(f"Resolved '{text}' to ({lat:.4f}, {lon:.4f})")
+    finally:
+        conn.close()
+    logger.info(f"Updated {changed} location rows from {len(entities)} entities")
+    return changed
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Entity index maintenance")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('backfill', help="Run NER once over messages missing from the index")
+    reresolve_parser = subparsers.add_parser('reresolve', help="Re-geocode place entities without NER")
+    reresolve_parser.add_argument('--entity', action='append', dest='names',
+                                  help="Place name to re-resolve (repeatable)")
+    find_parser = subparsers.add_parser('find', help="List the messages mentioning an entity")
+    find_parser.add_argument('name')
+    find_parser.add_argument('--label')
+    args = parser.parse_args()
+
+    if args.command == 'backfill':
+        backfill()
+    elif args.command == 'reresolve':
+        reresolve(args.names)
+    else:
+        print('\n'.join(str(i) for i in find_messages(args.name, args.label)))
@@ -0,0 +1,260 @@
+import asyncio
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
+
+from geopy.geocoders import get_geocoder_for_service
+
+from config import (
+    GEOCODE_BREAKER_RESET, GEOCODE_BREAKER_THRESHOLD, GEOCODE_HEDGE_DELAY,
+    GEOCODE_TIMEOUT, GEOCODERS
+)
+
+logger = logging.getLogger('Geocoder')
+
+# Shared by all hedged lookups in the process; losers keep running here after a winner returns
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='geocode')
+
+
+class GeocoderUnavailable(RuntimeError):
+    """No provider answered a lookup (breakers open, errors, timeout or no rate-limit slot)"""
+
+
+class CircuitBreaker:
+    """
+    Stop calling a provider after repeated failures, then probe it again
+
+    closed -> open after `threshold` consecutive failures; open -> half-open
+    once `reset_timeout` has passed, letting a single probe through; the
+    probe's outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, threshold=GEOCODE_BREAKER_THRESHOLD, reset_timeout=GEOCODE_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        """Whether a request may be sent now"""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Rolling window of request latencies"""
+
+    def __init__(self, window=200):
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, pct):
+        if not self.samples:
+            return None
+        if len(self.samples) == 1:
+            return self.samples[0]
+        return statistics.quantiles(self.samples, n=100)[pct - 1]
+
+
+class RateLimiter:
+    """Space the requests to one provider at least `min_interval` seconds apart"""
+
+    def __init__(self, min_interval=0.0):
+        self.min_interval = min_interval
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait):
+        """
+        Book the next free request slot
+
+        Returns:
+            float or None: Seconds to wait before sending, None if the slot is further than max_wait
+        """
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            if slot - now > max_wait:
+                return None
+            self._next_slot = slot + self.min_interval
+            return slot - now
+
+
+class Provider:
+    """A geopy geocoder with its own circuit breaker, rate limit and latency stats"""
+
+    def __init__(self, name, service, options=None, min_interval=0.0):
+        self.name = name
+        self.geocoder = get_geocoder_for_service(service)(timeout=GEOCODE_TIMEOUT, **(options or {}))
+        self.breaker = CircuitBreaker()
+        self.limiter = RateLimiter(min_interval)
+        self.latency = LatencyTracker()
+
+    def geocode(self, query, delay=0.0):
+        if delay:
+            time.sleep(delay)
+        start = time.monotonic()
+        try:
+            result = self.geocoder.geocode(query, exactly_one=True)
+        except Exception as e:
+            # Any error (not only GeopyError) must count, or a half-open probe never ends;
+            # timeouts are recorded too so p50/p99 reflect slow providers
+            self.latency.record(time.monotonic() - start)
+            self.breaker.record_failure()
+            logger.warning(f"{self.name} failed for '{query}': {e} (breaker {self.breaker.state})")
+            raise
+        self.latency.record(time.monotonic() - start)
+        self.breaker.record_success()
+        return result
+
+
+class HedgedGeocoder:
+    """
+    Race several geocoding providers with hedged requests
+
+    The healthiest provider (closed breaker, lowest median latency) is asked
+    first; if it has not answered after `hedge_delay` seconds, the next one is
+    started as well, and so on. The first provider to find the place wins.
+    Total latency is bounded by `timeout` however slow a backend gets.
+
+    Each request (hedges included) takes a slot from the provider's rate
+    limiter; a provider whose next slot is past the deadline is skipped.
+    """
+
+    def __init__(self, providers, hedge_delay=GEOCODE_HEDGE_DELAY, timeout=GEOCODE_TIMEOUT):
+        self.providers = providers
+        self.hedge_delay = hedge_delay
+        self.timeout = timeout
+
+    def _ranked(self):
+        def key(provider):
+            p50 = provider.latency.percentile(50)
+            return (provider.breaker.state != 'closed', p50 if p50 is not None else 0.0)
+        return sorted(self.providers, key=key)
+
+    def geocode_blocking(self, query):
+        """
+        Geocode a query with hedging across providers
+
+        Args:
+            query (str): Place to look up
+
+        Returns:
+            tuple: (geopy Location or None, provider name or None); the location
+                is None only when a provider answered that the place was not found
+
+        Raises:
+            GeocoderUnavailable: If no provider answered before the deadline
+        """
+        answered = False
+        deadline = time.monotonic() + self.timeout
+        pending = {}
+        candidates = iter(self._ranked())
+
+        def launch_next():
+            for provider in candidates:
+                if provider.breaker.state == 'open':
+                    continue
+                delay = provider.limiter.reserve(deadline - time.monotonic())
+                if delay is None:
+                    continue
+                if provider.breaker.allow():
+                    pending[_executor.submit(provider.geocode, query, delay)] = provider
+                    return True
+            return False
+
+        launch_next()
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, _ = wait(pending, timeout=min(self.hedge_delay, remaining), return_when=FIRST_COMPLETED)
+            for future in done:
+                provider = pending.pop(future)
+                if future.exception() is None:
+                    if future.result() is not None:
+                        # Losing requests finish in the background and only update their stats
+                        return future.result(), provider.name
+                    answered = True
+            # Hedge: nothing useful yet (slow, failed or not found), bring in the next provider
+            if not launch_next() and not pending:
+                break
+        if not answered:
+            raise GeocoderUnavailable(f"No geocoding provider answered for '{query}'")
+        return None, None
+
+    async def geocode(self, query):
+        """Async wrapper of geocode_blocking for the listener's event loop (same result and errors)"""
+        return await asyncio.get_running_loop().run_in_executor(None, self.geocode_blocking, query)
+
+    def stats(self):
+        """
+        Per-provider health for logging/monitoring
+
+        Returns:
+            dict: name -> {state, p50, p99, samples}
+        """
+        return {
+            p.name: {
+                'state': p.breaker.state,
+                'p50': p.latency.percentile(50),
+                'p99': p.latency.percentile(99),
+                'samples': len(p.latency.samples),
+            }
+            for p in self.providers
+        }
+
+
+@lru_cache(maxsize=None)
+def get_geocoder(user_agent):
+    """
+    Build the process-wide hedged geocoder from config.GEOCODERS
+
+    Args:
+        user_agent (str): User agent for providers that require one (Nominatim)
+
+    Returns:
+        HedgedGeocoder: Shared geocoder
+    """
+    providers = []
+    for spec in GEOCODERS:
+        options = dict(spec.get('options', {}))
+        if spec['service'] == 'nominatim':
+            options.setdefault('user_agent', user_agent)
+        providers.append(Provider(spec['name'], spec['service'], options, spec.get('min_interval', 0.0)))
+    return HedgedGeocoder(providers)
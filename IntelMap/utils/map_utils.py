@@ -100,3 +100,23 @@ def create_callout_layer(data, selected_points):
     )
     
     return callout_layer
+
+def to_layer_records(data, columns=("id", "latitude", "longitude", "location_name", "preview")):
+    """
+    Build the JSON-safe payload for a PyDeck layer from the compact dashboard frame
+    
+    Only the columns the layer and its tooltip need are serialized, with
+    categoricals, float32 and Arrow strings converted to plain Python values.
+    
+    Args:
+        data (pd.DataFrame): Compact dashboard frame
+        columns (tuple): Columns to include in each record
+        
+    Returns:
+        list: One dict per point
+    """
+    subset = data[list(columns)]
+    return [
+        {col: (value.item() if hasattr(value, "item") else value) for col, value in zip(columns, row)}
+        for row in subset.astype(object).itertuples(index=False, name=None)
+    ]
@@ -0,0 +1,93 @@
+import hashlib
+import os
+import time
+
+from config import MEDIA_DIR, THUMBNAIL_SIZE
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+VIDEO_EXTENSIONS = ('.mp4', '.webm', '.mov')
+THUMBNAIL_SUFFIX = '.thumb.jpg'
+
+
+def shard_dir(name, media_dir=MEDIA_DIR):
+    """
+    Get the hashed subdirectory a media file belongs in
+
+    Two levels of 256 buckets keep every directory small even with
+    hundreds of thousands of files.
+
+    Args:
+        name (str): Base name of the media file (extension optional)
+        media_dir (str): Root media directory
+
+    Returns:
+        str: Absolute path of the shard directory (created if missing)
+    """
+    name = os.path.basename(name)
+    if name.endswith(THUMBNAIL_SUFFIX):
+        name = name[:-len(THUMBNAIL_SUFFIX)]
+    stem = os.path.splitext(name)[0]
+    digest = hashlib.sha1(stem.encode('utf-8')).hexdigest()
+    directory = os.path.join(media_dir, digest[:2], digest[2:4])
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def to_relative(path, media_dir=MEDIA_DIR):
+    """Store media paths relative to the media directory"""
+    if os.path.isabs(path):
+        return os.path.relpath(path, media_dir)
+    return path
+
+
+def resolve(media_file, media_dir=MEDIA_DIR):
+    """
+    Resolve a media_paths entry to an absolute path
+
+    Older rows store absolute paths or flat file names, newer ones a path
+    relative to the media directory; all three are handled.
+
+    Args:
+        media_file (str): Entry from messages.media_paths
+        media_dir (str): Root media directory
+
+    Returns:
+        str: Absolute path (may not exist if the file was evicted)
+    """
+    return os.path.join(media_dir, media_file.strip())
+
+
+def thumbnail_path(path):
+    """Path of the thumbnail kept next to a full-size image"""
+    return os.path.splitext(path)[0] + THUMBNAIL_SUFFIX
+
+
+def make_thumbnail(path):
+    """
+    Create a small JPEG thumbnail next to an image
+
+    Thumbnails survive media eviction so referenced messages still show a preview.
+
+    Args:
+        path (str): Absolute path of the full-size image
+
+    Returns:
+        str or None: Thumbnail path, or None if the file is not an image
+    """
+    if not path.lower().endswith(IMAGE_EXTENSIONS):
+        return None
+    from PIL import Image
+
+    target = thumbnail_path(path)
+    with Image.open(path) as img:
+        img.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        img.convert('RGB').save(target, 'JPEG', quality=80)
+    return target
+
+
+def touch(path):
+    """Refresh a file's access time (mtime is kept as the download time) for LRU eviction"""
+    try:
+        os.utime(path, (time.time(), os.stat(path).st_mtime))
+    except OSError:
+        pass
@@ -0,0 +1,295 @@
+import logging
+import os
+import re
+import unicodedata
+from functools import lru_cache
+
+import spacy
+
+from config import GAZETTEER_DIR, NER_MODELS
+
+logger = logging.getLogger('NLP')
+
+# Entity labels that denote places in the English and the multilingual/news models
+PLACE_LABELS = ('GPE', 'LOC')
+
+_CYRILLIC_RE = re.compile(r"[Ѐ-ӿ]")
+_LATIN_RE = re.compile(r"[A-Za-z]")
+_UKRAINIAN_RE = re.compile(r"[іїєґІЇЄҐ]")
+_RUSSIAN_RE = re.compile(r"[ыэъёЫЭЪЁ]")
+_PUNCT_EDGE_RE = re.compile(r"^[\W_]+|[\W_]+$")
+
+# Case endings of Russian/Ukrainian place names ("в Покровске", "під Бахмутом")
+_CASE_ENDINGS = frozenset((
+    '', 'а', 'я', 'у', 'ю', 'е', 'є', 'и', 'і', 'ы', 'о',
+    'ой', 'ей', 'ом', 'ем', 'ою', 'ею', 'ям', 'ам', 'ах', 'ях', 'ові', 'еві',
+))
+_MAX_ENDING = max(len(e) for e in _CASE_ENDINGS)
+# Final letters dropped to get a name's stem ("Одеса" -> "одес", "Маріуполь" -> "маріупол")
+_STEM_FINALS = 'аяоеєьйиіїы'
+# Shorter stems only match exactly, otherwise "Суми" would match "сума"
+_MIN_STEM = 4
+# Pipes kept when loading a model: NER plus what the lemmatizer needs for inflected mentions
+_MODEL_PIPES = ('tok2vec', 'tagger', 'morphologizer', 'attribute_ruler', 'lemmatizer', 'ner')
+
+
+def detect_language(text):
+    """
+    Guess the language of a message from its script
+
+    Cyrillic text is split into Ukrainian/Russian using the letters only one
+    of them has. Latin text is treated as English and anything else goes to
+    the multilingual model.
+
+    Args:
+        text (str): Message text
+
+    Returns:
+        str: Language code ('en', 'ru', 'uk' or 'xx')
+    """
+    text = text or ""
+    cyrillic = len(_CYRILLIC_RE.findall(text))
+    latin = len(_LATIN_RE.findall(text))
+    if cyrillic > latin:
+        if len(_UKRAINIAN_RE.findall(text)) > len(_RUSSIAN_RE.findall(text)):
+            return 'uk'
+        return 'ru'
+    if latin:
+        return 'en'
+    return 'xx'
+
+
+def _fold(word):
+    return word.lower().replace('ё', 'е')
+
+
+def _stems(word):
+    """Stems a gazetteer word may appear under once inflected"""
+    word = _fold(word)
+    stem = word[:-1] if word[-1:] in _STEM_FINALS else word
+    if len(stem) < _MIN_STEM:
+        return {word}
+    stems = {stem}
+    # Ukrainian і/ї in the last syllable alternates with о/е/є ("Харків" -> "Харкова", "Київ" -> "Києва")
+    if len(stem) > 2 and stem[-2] in 'ії':
+        stems.update(stem[:-2] + vowel + stem[-1] for vowel in 'оеє')
+    return stems
+
+
+def _word_matches(token, stems):
+    token = _fold(token)
+    if token in stems:
+        return True
+    for cut in range(1, _MAX_ENDING + 1):
+        if len(token) > cut and token[:-cut] in stems and token[-cut:] in _CASE_ENDINGS:
+            return True
+    return False
+
+
+@lru_cache(maxsize=None)
+def _load_gazetteer(lang):
+    """
+    Build a stem index over the language's gazetteer file
+
+    Returns:
+        tuple or None: (blank nlp, {first word stem: [(stems per word, name)]})
+    """
+    path = os.path.join(GAZETTEER_DIR, f"{lang}.txt")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        names = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    nlp = spacy.blank(lang)
+    index = {}
+    for name in names:
+        words = [_stems(t.text) for t in nlp.make_doc(name)]
+        for stem in words[0]:
+            index.setdefault(stem, []).append((words, name))
+    logger.info(f"Loaded gazetteer for '{lang}' ({len(names)} names)")
+    return nlp, index
+
+
+def _match_gazetteer(doc, index):
+    """Yield (start, end, name) token spans of gazetteer names, inflected forms included"""
+    i = 0
+    while i < len(doc):
+        token = _fold(doc[i].text)
+        candidates = []
+        for cut in range(0, _MAX_ENDING + 1):
+            if len(token) > cut:
+                candidates.extend(index.get(token[:len(token) - cut], ()))
+        match = None
+        for words, name in candidates:
+            end = i + len(words)
+            if end <= len(doc) and all(_word_matches(doc[i + k].text, words[k]) for k in range(len(words))):
+                if match is None or end > match[1]:
+                    match = (i, end, name)
+        if match:
+            yield match
+            i = match[1]
+        else:
+            i += 1
+
+
+@lru_cache(maxsize=None)
+def get_extractor(lang):
+    """
+    Lazily load the place extractor for a language
+
+    The configured spaCy model is preferred (with everything but NER and
+    lemmatization disabled); when it is not installed, the language's
+    gazetteer file is matched instead, on word stems so inflected mentions
+    are found too.
+
+    Args:
+        lang (str): Language code
+
+    Returns:
+        tuple or None: ('model', nlp) or ('gazetteer', (nlp, index)), None if nothing is available
+    """
+    model = NER_MODELS.get(lang)
+    if model:
+        try:
+            nlp = spacy.load(model)
+            nlp.select_pipes(enable=[p for p in nlp.pipe_names if p in _MODEL_PIPES])
+            logger.info(f"Loaded NER model {model} for '{lang}'")
+            return 'model', nlp
+        except OSError:
+            logger.warning(f"NER model {model} not installed, trying gazetteer for '{lang}'")
+    gazetteer = _load_gazetteer(lang)
+    if gazetteer:
+        return 'gazetteer', gazetteer
+    logger.warning(f"No place extractor available for '{lang}'")
+    return None
+
+
+def normalize_entity(text):
+    """
+    Normalize an entity's text for indexing and lookups
+
+    Unicode compatibility forms, case, surrounding punctuation (quotes,
+    hashtags) and repeated whitespace are folded, so "«Покровськ»" and
+    "покровськ" share one index entry.
+
+    Args:
+        text (str): Entity surface text
+
+    Returns:
+        str: Normalized text
+    """
+    text = unicodedata.normalize('NFKC', text or "")
+    text = _PUNCT_EDGE_RE.sub("", text)
+    return " ".join(text.casefold().split())
+
+
+def _entity(text, label, start, end, lang, lemma=None):
+    # lemma: base form of the entity (gazetteer name for inflected mentions)
+    lemma = lemma or text
+    return {
+        'text': text,
+        'lemma': lemma,
+        'label': label,
+        'start': start,
+        'end': end,
+        'lang': lang,
+        'normalized': normalize_entity(lemma),
+    }
+
+
+def _model_lemma(ent, gazetteer):
+    """Base form of a model entity: the gazetteer name it inflects, else the lemmatizer's output"""
+    if gazetteer:
+        for start, end, name in _match_gazetteer(ent, gazetteer[1]):
+            if start == 0 and end == len(ent):
+                return name
+    lemma = ent.lemma_.strip()
+    if not lemma or lemma.casefold() == ent.text.casefold():
+        return ent.text
+    # Lemmatizers lowercase proper nouns ("в Покровске" -> "покровск")
+    return " ".join(word[:1].upper() + word[1:] for word in lemma.split())
+
+
+def _extract_batch(lang, texts):
+    extractor = get_extractor(lang)
+    if extractor is None:
+        return [[] for _ in texts]
+    kind, engine = extractor
+    if kind == 'model':
+        gazetteer = _load_gazetteer(lang)
+        return [
+            [_entity(ent.text, ent.label_, ent.start_char, ent.end_char, lang, lemma=_model_lemma(ent, gazetteer))
+             for ent in doc.ents]
+            for doc in engine.pipe(texts, batch_size=64)
+        ]
+    nlp, index = engine
+    results = []
+    for doc in nlp.pipe(texts, batch_size=256):
+        spans = [(doc[start:end], name) for start, end, name in _match_gazetteer(doc, index)]
+        results.append([_entity(span.text, 'LOC', span.start_char, span.end_char, lang, lemma=name)
+                         for span, name in spans])
+    return results
+
+
+def extract_entities_batch(texts):
+    """
+    Extract named entities from many messages, grouping them by language
+
+    Args:
+        texts (list): Message texts
+
+    Returns:
+        list: One list per input text of dicts with text (as written), lemma,
+            label, start, end, lang and normalized, in input order
+    """
+    by_lang = {}
+    for i, text in enumerate(texts):
+        by_lang.setdefault(detect_language(text), []).append(i)
+
+    results = [[] for _ in texts]
+    for lang, indices in by_lang.items():
+        batch = [texts[i] or "" for i in indices]
+        for i, entities in zip(indices, _extract_batch(lang, batch)):
+            results[i] = entities
+    return results
+
+
+def extract_entities(text):
+    """
+    Extract named entities from a single message
+
+    Args:
+        text (str): Message text
+
+    Returns:
+        list: Entity dicts (see extract_entities_batch)
+    """
+    return extract_entities_batch([text])[0]
+
+
+def extract_places_batch(texts):
+    """
+    Extract place names from many messages, grouping them by language
+
+    Args:
+        texts (list): Message texts
+
+    Returns:
+        list: One list of place names (base forms) per input text, in input order
+    """
+    return [
+        [ent['lemma'] for ent in entities if ent['label'] in PLACE_LABELS]
+        for entities in extract_entities_batch(texts)
+    ]
+
+
+def extract_places(text):
+    """
+    Extract place names from a single message
+
+    Args:
+        text (str): Message text
+
+    Returns:
+        list: Place names in order of appearance
+    """
+    return extract_places_batch([text])[0]
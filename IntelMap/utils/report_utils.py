@@ -1,6 +1,7 @@
 import pandas as pd
 import plotly.express as px
 from datetime import datetime
+from utils.archive_utils import daily_activity, top_locations
 
 def generate_report(data):
     """
@@ -87,3 +88,39 @@ def generate_report(data):
     }
     
     return report
+
+def generate_history_report(start, end):
+    """
+    Generate a long-range activity report over the archive and the hot database
+    
+    Args:
+        start (date): First day of the period
+        end (date): Last day of the period
+        
+    Returns:
+        dict: Dictionary containing report components
+    """
+    activity = daily_activity(start, end)
+    locations = top_locations(start, end)
+    
+    if not activity.empty:
+        activity_fig = px.bar(
+            activity,
+            x='date',
+            y='messages',
+            color='channel',
+            height=400
+        )
+    else:
+        activity_fig = px.bar(pd.DataFrame({'date': [], 'messages': []}), x='date', y='messages', height=400)
+    activity_fig.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0})
+    
+    report = {
+        'total_messages': int(activity['messages'].sum()) if not activity.empty else 0,
+        'date_range': f"{start} to {end}",
+        'activity_fig': activity_fig,
+        'top_locations': locations,
+        'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+    
+    return report
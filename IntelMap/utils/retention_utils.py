@@ -0,0 +1,229 @@
+import argparse
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+
+from config import (
+    DB_PATH, HOT_RETENTION_DAYS, MEDIA_BUDGET_BYTES, MEDIA_DIR,
+    MEDIA_MAX_AGE_DAYS, RETENTION_INTERVAL_SECONDS, RETENTION_MODE
+)
+from utils.archive_utils import archive_old_rows, compact_archive, load_archive
+from utils.db_utils import init_schema
+from utils.media_utils import THUMBNAIL_SUFFIX, shard_dir, to_relative
+
+logger = logging.getLogger('Retention')
+
+# Pages released per incremental_vacuum call (4 KiB pages -> ~40 MB)
+VACUUM_PAGES = 10000
+ORPHAN_GRACE_SECONDS = 3600
+
+
+def _split_media(media_paths):
+    return [p.strip() for p in (media_paths or '').split(',') if p.strip()]
+
+
+def referenced_media(db_path=DB_PATH):
+    """
+    Collect the media files still referenced by a message (hot or archived)
+
+    Args:
+        db_path (str): Path to the SQLite database
+
+    Returns:
+        set: Paths relative to MEDIA_DIR
+    """
+    referenced = set()
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute("SELECT media_paths FROM messages WHERE media_paths != ''").fetchall()
+    archived = load_archive('messages', columns=['media_paths']).column('media_paths').to_pylist()
+    for media_paths in [r[0] for r in rows] + archived:
+        for path in _split_media(media_paths):
+            rel = to_relative(path)
+            referenced.add(rel)
+            if not os.path.dirname(rel):
+                # Archived rows keep pre-sharding flat names; their files now live in a shard
+                referenced.add(to_relative(os.path.join(shard_dir(rel), rel)))
+    return referenced
+
+
+def shard_flat_media(db_path=DB_PATH, media_dir=MEDIA_DIR):
+    """
+    Move media stored directly in MEDIA_DIR into hashed subdirectories
+
+    Messages pointing at a moved file are updated to the new relative path.
+
+    Returns:
+        int: Number of files moved
+    """
+    moved = {}
+    for entry in os.scandir(media_dir):
+        if not entry.is_file():
+            continue
+        target = os.path.join(shard_dir(entry.name, media_dir), entry.name)
+        shutil.move(entry.path, target)
+        moved[entry.name] = to_relative(target, media_dir)
+    if not moved:
+        return 0
+
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute("SELECT id, media_paths FROM messages WHERE media_paths != ''").fetchall()
+        updates = []
+        for msg_id, media_paths in rows:
+            paths = _split_media(media_paths)
+            new_paths = [moved.get(os.path.basename(p), p) for p in paths]
+            if new_paths != paths:
+                updates.append((','.join(new_paths), msg_id))
+        conn.executemany("UPDATE messages SET media_paths = ? WHERE id = ?", updates)
+        conn.commit()
+    logger.info(f"Sharded {len(moved)} media files")
+    return len(moved)
+
+
+def enforce_media_budget(budget_bytes=MEDIA_BUDGET_BYTES, max_age_days=MEDIA_MAX_AGE_DAYS,
+                         db_path=DB_PATH, media_dir=MEDIA_DIR):
+    """
+    Evict full-size media older than max_age_days, then least recently used files over budget
+
+    Thumbnails of referenced messages are kept (they are tiny and let the
+    dashboard still show a preview); thumbnails of messages that no longer
+    exist anywhere are removed.
+
+    Args:
+        budget_bytes (int): Maximum total size of the media directory
+        max_age_days (int): Age after which full-size media is always evicted
+        db_path (str): Path to the SQLite database
+        media_dir (str): Root media directory
+
+    Returns:
+        int: Bytes freed
+    """
+    referenced = referenced_media(db_path)
+    referenced_stems = {os.path.splitext(p)[0] for p in referenced}
+    age_cutoff = time.time() - max_age_days * 86400
+
+    originals, total, freed = [], 0, 0
+    for directory, _, files in os.walk(media_dir):
+        for name in files:
+            path = os.path.join(directory, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            rel = to_relative(path, media_dir)
+            if name.endswith(THUMBNAIL_SUFFIX):
+                if rel[:-len(THUMBNAIL_SUFFIX)] not in referenced_stems:
+                    os.remove(path)
+                    freed += st.st_size
+                else:
+                    total += st.st_size
+                continue
+            # Unreferenced files get a grace period: the listener writes media before its row
+            orphan = rel not in referenced and st.st_mtime < time.time() - ORPHAN_GRACE_SECONDS
+            if st.st_mtime < age_cutoff or orphan:
+                os.remove(path)
+                freed += st.st_size
+                continue
+            total += st.st_size
+            originals.append((max(st.st_atime, st.st_mtime), st.st_size, path))
+
+    # Least recently used first
+    originals.sort()
+    for _, size, path in originals:
+        if total <= budget_bytes:
+            break
+        os.remove(path)
+        total -= size
+        freed += size
+
+    logger.info(f"Media: freed {freed / 1e6:.1f} MB, now {total / 1e6:.1f} MB")
+    return freed
+
+
+def expire_rows(db_path=DB_PATH, days=HOT_RETENTION_DAYS, mode=RETENTION_MODE):
+    """
+    Archive or delete messages older than the hot retention window
+
+    Args:
+        db_path (str): Path to the SQLite database
+        days (int): Age in days after which rows expire
+        mode (str): 'archive' to move rows to Parquet, 'delete' to drop them
+
+    Returns:
+        int: Number of expired messages
+    """
+    if mode == 'archive':
+        count = archive_old_rows(db_path, days=days)
+        compact_archive()
+        return count
+
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+    with sqlite3.connect(db_path) as conn:
+        init_schema(conn)
+        conn.execute('''
+            DELETE FROM locations
+            WHERE message_id IN (SELECT id FROM messages WHERE timestamp <= ?)
+        ''', (cutoff,))
+        conn.execute('''
+            DELETE FROM message_entities
+            WHERE message_id IN (SELECT id FROM messages WHERE timestamp <= ?)
+        ''', (cutoff,))
+        count = conn.execute("DELETE FROM messages WHERE timestamp <= ?", (cutoff,)).rowcount
+        conn.commit()
+    logger.info(f"Deleted {count} messages older than {cutoff}")
+    return count
+
+
+def compact_database(db_path=DB_PATH):
+    """
+    Return free pages to the filesystem and refresh planner statistics
+
+    The first run switches the database to incremental auto-vacuum, which
+    needs one full VACUUM; later runs only release a bounded number of pages.
+
+    Args:
+        db_path (str): Path to the SQLite database
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            logger.info("Enabling incremental auto-vacuum (one-time full VACUUM)")
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+        conn.execute(f'PRAGMA incremental_vacuum({VACUUM_PAGES})').fetchall()
+        conn.execute('ANALYZE')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def run_retention(db_path=DB_PATH):
+    """Run every retention step once"""
+    # Shard first: paths are only rewritten in SQLite, so rows must not be archived with flat names
+    shard_flat_media(db_path)
+    expire_rows(db_path)
+    enforce_media_budget(db_path=db_path)
+    compact_database(db_path)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Media/database retention job")
+    parser.add_argument('--loop', action='store_true',
+                        help=f"Repeat every {RETENTION_INTERVAL_SECONDS} s instead of running once")
+    args = parser.parse_args()
+
+    while True:
+        try:
+            run_retention()
+        except Exception as e:
+            logger.error(f"Retention run failed: {str(e)}")
+            if not args.loop:
+                raise
+        if not args.loop:
+            break
+        time.sleep(RETENTION_INTERVAL_SECONDS)
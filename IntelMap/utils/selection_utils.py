@@ -0,0 +1,95 @@
+import pandas as pd
+
+
+def add_to_selection(selection, ids):
+    """
+    Add message ids to a selection set
+
+    Args:
+        selection (set): Selected message ids (modified in place)
+        ids (Iterable[int]): Ids to add
+
+    Returns:
+        int: Number of ids that were not already selected
+    """
+    before = len(selection)
+    selection.update(int(i) for i in ids)
+    return len(selection) - before
+
+
+def ids_in_bbox(data, lat_range, lon_range):
+    """
+    Get the ids of the messages inside a bounding box
+
+    Args:
+        data (pd.DataFrame): Dashboard data with latitude/longitude columns
+        lat_range (tuple): (min_lat, max_lat)
+        lon_range (tuple): (min_lon, max_lon)
+
+    Returns:
+        list: Matching message ids
+    """
+    if data.empty:
+        return []
+    mask = (
+        data['latitude'].between(*lat_range) &
+        data['longitude'].between(*lon_range)
+    )
+    return data.loc[mask, 'id'].tolist()
+
+
+def ids_in_time_range(data, start, end):
+    """
+    Get the ids of the messages posted between two instants
+
+    Args:
+        data (pd.DataFrame): Dashboard data with a tz-aware timestamp column
+        start (datetime): Range start (inclusive)
+        end (datetime): Range end (inclusive)
+
+    Returns:
+        list: Matching message ids
+    """
+    if data.empty:
+        return []
+    mask = data['timestamp'].between(pd.Timestamp(start), pd.Timestamp(end))
+    return data.loc[mask, 'id'].tolist()
+
+
+def ids_matching_location(data, query):
+    """
+    Get the ids of the messages whose location name contains a query
+
+    Full-text search runs in SQLite (db_utils.search_message_ids) because the
+    dashboard frame only keeps a text preview.
+
+    Args:
+        data (pd.DataFrame): Dashboard data with a location_name column
+        query (str): Case-insensitive search string
+
+    Returns:
+        list: Matching message ids
+    """
+    query = (query or "").strip()
+    if data.empty or not query:
+        return []
+    mask = data['location_name'].astype(str).str.contains(query, case=False, regex=False)
+    return data.loc[mask, 'id'].tolist()
+
+
+def ids_from_map_selection(event, layer_id):
+    """
+    Extract the picked message ids from a st.pydeck_chart selection event
+
+    Args:
+        event: Selection state returned by st.pydeck_chart(on_select=...)
+        layer_id (str): Id of the pydeck layer holding the messages
+
+    Returns:
+        list: Picked message ids
+    """
+    try:
+        objects = event.selection.objects.get(layer_id, [])
+    except AttributeError:
+        return []
+    return [obj['id'] for obj in objects if 'id' in obj]
@@ -0,0 +1,89 @@
+import logging
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from config import DB_PATH
+
+logger = logging.getLogger('SnapshotRefresher')
+
+# data is shared by every dashboard session and must be treated as read-only
+Snapshot = namedtuple('Snapshot', ['data', 'built_at', 'error'])
+
+
+class SnapshotRefresher:
+    """
+    Keep a dashboard snapshot up to date from a single background thread
+
+    The database is polled cheaply (PRAGMA data_version and MAX(messages.id))
+    and the snapshot is only rebuilt when one of them changes, or when it is
+    older than max_age so relative times and the time window stay current.
+    A new snapshot replaces the old one with a single reference assignment,
+    so readers never see a half-built frame.
+    """
+
+    def __init__(self, build, db_path=DB_PATH, poll_interval=2.0, max_age=60.0):
+        """
+        Args:
+            build (Callable[[], pd.DataFrame]): Function that builds the snapshot data
+            db_path (str): Path to the SQLite database
+            poll_interval (float): Seconds between change checks
+            max_age (float): Seconds after which the snapshot is rebuilt anyway
+        """
+        self._build = build
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.max_age = max_age
+        self._snapshot = None
+        self._built_monotonic = 0.0
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='snapshot-refresher', daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _db_state(conn):
+        try:
+            version = conn.execute('PRAGMA data_version').fetchone()[0]
+            max_id = conn.execute('SELECT MAX(id) FROM messages').fetchone()[0]
+            return version, max_id
+        except sqlite3.Error:
+            return None
+
+    def _refresh(self):
+        try:
+            snapshot = Snapshot(self._build(), datetime.now(), None)
+        except Exception as e:
+            logger.error(f"Snapshot build failed: {e}")
+            previous = self._snapshot
+            snapshot = Snapshot(previous.data if previous else None, datetime.now(), str(e))
+        self._snapshot = snapshot
+        self._built_monotonic = time.monotonic()
+        self._ready.set()
+
+    def _run(self):
+        # data_version only changes for commits made by *other* connections,
+        # so the poller keeps its own long-lived connection
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        state = None
+        while True:
+            current = self._db_state(conn)
+            expired = time.monotonic() - self._built_monotonic > self.max_age
+            if self._snapshot is None or current != state or expired:
+                self._refresh()
+                state = current
+            time.sleep(self.poll_interval)
+
+    def get(self, timeout=None):
+        """
+        Return the latest published snapshot, waiting for the first build if needed
+
+        Args:
+            timeout (float, optional): Maximum seconds to wait for the first build
+
+        Returns:
+            Snapshot or None: Latest snapshot (None if the first build is not ready)
+        """
+        self._ready.wait(timeout)
+        return self._snapshot